@@ -1,8 +1,9 @@
 from django.contrib import admin
-from .models import Ticket, Technician, TicketNote
+from django.utils import timezone
+from .models import APIToken, History, OutboundMail, Ticket, Technician, TicketNote, TicketSubscriber
 
 class TicketAdmin(admin.ModelAdmin):
-    list_display=('short_description', 'when', 'is_resolved')
+    list_display=('short_description', 'when', 'is_resolved', 'note_count', 'last_activity_at')
     fields=(
         'item',
         'location',
@@ -17,6 +18,12 @@ class TicketAdmin(admin.ModelAdmin):
         'recipient_emails'
     )
 
+    def save_model(self, request, obj, form, change):
+        if change:
+            obj.save(update_fields=Ticket.get_form_update_fields(form))
+        else:
+            super().save_model(request, obj, form, change)
+
 admin.site.register(Ticket, TicketAdmin)
 
 class TechnicianAdmin(admin.ModelAdmin):
@@ -25,3 +32,42 @@ class TechnicianAdmin(admin.ModelAdmin):
 admin.site.register(Technician, TechnicianAdmin)
 
 admin.site.register(TicketNote)
+
+class TicketSubscriberAdmin(admin.ModelAdmin):
+    list_display=('email', 'ticket', 'user')
+    search_fields=('email',)
+    raw_id_fields=('ticket', 'user')
+
+admin.site.register(TicketSubscriber, TicketSubscriberAdmin)
+
+class OutboundMailAdmin(admin.ModelAdmin):
+    list_display=('subject', 'recipients', 'status', 'attempts', 'next_attempt', 'sent_when')
+    list_filter=('status',)
+    actions=['requeue']
+
+    @admin.action(description='Queue the selected emails to be sent again')
+    def requeue(self, request, queryset):
+        queryset.update(status=OutboundMail.STATUS_QUEUED, attempts=0, next_attempt=timezone.now())
+
+admin.site.register(OutboundMail, OutboundMailAdmin)
+
+class HistoryAdmin(admin.ModelAdmin):
+    list_display=('__str__', 'user', 'when')
+    list_filter=('modelname',)
+    list_select_related=('user',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_object_labels()
+
+admin.site.register(History, HistoryAdmin)
+
+class APITokenAdmin(admin.ModelAdmin):
+    list_display=('name', 'user', 'created')
+    fields=('name', 'user', 'created')
+    readonly_fields=('user', 'created')
+
+    # tokens are made with the libtekticket_create_api_token command, which shows the key once
+    def has_add_permission(self, request):
+        return False
+
+admin.site.register(APIToken, APITokenAdmin)
@@ -0,0 +1,578 @@
+import hashlib
+import json
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+
+from django.contrib.auth.mixins import PermissionRequiredMixin
+from django.core.exceptions import PermissionDenied
+from django.core.paginator import InvalidPage
+from django.db import transaction
+from django.forms import model_to_dict, modelform_factory
+from django.http import Http404, HttpResponse, JsonResponse
+from django.utils import timezone
+from django.middleware.csrf import CsrfViewMiddleware
+from django.utils.cache import get_conditional_response
+from django.utils.decorators import method_decorator
+from django.utils.http import http_date
+from django.views.decorators.csrf import csrf_exempt
+from django.views.generic.base import View
+
+from .models import APIToken, History, Technician, Ticket, TicketNote, get_related_labels_version
+from .pagination import KeysetPaginator
+from .views import describe_changes, get_default_recipient_emails, get_history, send_ticket_mail
+
+TICKET_FIELDS = [
+    'id', 'item', 'location', 'short_description', 'long_description', 'urgency', 'submitted_by', 'when',
+    'technician', 'is_resolved', 'resolution_notes', 'recipient_emails', 'note_count', 'last_activity_at',
+    'resolved_at', 'first_note_at', 'updated_at',
+]
+TICKET_WRITABLE_FIELDS = [
+    'item', 'location', 'short_description', 'long_description', 'urgency', 'technician', 'is_resolved',
+    'resolution_notes', 'recipient_emails',
+]
+TICKETNOTE_FIELDS = ['id', 'ticket', 'maintext', 'submitted_by', 'when', 'updated_at']
+TICKETNOTE_WRITABLE_FIELDS = ['maintext', 'when']
+TECHNICIAN_FIELDS = ['id', 'name', 'is_current', 'user']
+TECHNICIAN_WRITABLE_FIELDS = ['name', 'is_current', 'user']
+
+
+class APIError(Exception):
+
+    def __init__(self, message, status=400, errors=None):
+        super().__init__(message)
+        self.status = status
+        self.errors = errors
+
+
+def serialize(obj, fields):
+    """A dict of the chosen fields of obj.  Related objects become their id and name"""
+
+    data = {}
+    for name in fields:
+        if name == 'id':
+            data[name] = obj.pk
+            continue
+        field = obj._meta.get_field(name)
+        if field.is_relation:
+            related = getattr(obj, name)
+            data[name] = None if related is None else {'id': related.pk, 'name': str(related)}
+        else:
+            value = field.value_from_object(obj)
+            data[name] = value.isoformat() if hasattr(value, 'isoformat') else value
+    return data
+
+
+def version_to_datetime(version):
+    return datetime.fromtimestamp(version / 1e9, tz=dt_timezone.utc)
+
+
+class CsrfCheck(CsrfViewMiddleware):
+    """The CSRF middleware's check, run by the API itself so a rejection can be answered with JSON"""
+
+    def _reject(self, request, reason):
+        return reason
+
+    @classmethod
+    def get_rejection(cls, request):
+        """The reason the request fails the CSRF check, or None if it passes"""
+
+        check = cls(lambda request: None)
+        check.process_request(request)
+        return check.process_view(request, None, (), {})
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class APIView(PermissionRequiredMixin, View):
+    """A JSON view whose required permission depends on the request method
+
+    Subclasses set model, fields (the readable fields, all of which are
+    returned unless the fields parameter names some of them) and
+    method_permissions (the permission action for each method, 'view' if not
+    given)
+
+    Clients sign in with an API token sent as "Authorization: Token <key>",
+    or with the site's session, whose writes need a CSRF token as the site's
+    forms do
+
+    """
+
+    raise_exception = True
+    model = None
+    fields = []
+    method_permissions = {}
+    http_method_names = ['get', 'post', 'patch', 'delete', 'head', 'options']
+
+    def get_permission_required(self):
+        action = self.method_permissions.get(self.request.method.lower(), 'view')
+        return [f'{self.model._meta.app_label}.{action}_{self.model._meta.model_name}']
+
+    def dispatch(self, request, *args, **kwargs):
+        try:
+            self.authenticate(request)
+            return super().dispatch(request, *args, **kwargs)
+        except APIError as error:
+            body = {'error': str(error)}
+            if error.errors:
+                body['errors'] = error.errors
+            response = JsonResponse(body, status=error.status)
+            if error.status == 401:
+                response['WWW-Authenticate'] = 'Token'
+            return response
+        except PermissionDenied as error:
+            return JsonResponse({'error': str(error) or 'You do not have permission to do this'}, status=403)
+        except Http404 as error:
+            return JsonResponse({'error': str(error)}, status=404)
+
+    def authenticate(self, request):
+        """Sign in the user of the request's API token, or check the CSRF token of a request using the session
+
+        Tokens are not sent by browsers on their own, so requests with one don't need a CSRF token
+        """
+
+        keyword, _, key = request.META.get('HTTP_AUTHORIZATION', '').partition(' ')
+        if keyword.lower() == 'token':
+            user = APIToken.objects.get_user(key.strip())
+            if user is None:
+                raise APIError('The API token is not valid', status=401)
+            request.user = user
+            return
+
+        reason = CsrfCheck.get_rejection(request)
+        if reason is not None:
+            raise APIError(f'CSRF check failed: {reason}', status=403)
+
+    def get_fields(self):
+        """The fields named in the fields parameter, or all readable fields"""
+
+        requested = [name.strip() for name in self.request.GET.get('fields', '').split(',') if name.strip()]
+        if not requested:
+            return list(self.fields)
+        unknown = [name for name in requested if name not in self.fields]
+        if unknown:
+            raise APIError(f"Unknown fields: {', '.join(unknown)}")
+        return requested
+
+    def get_related_fields(self, fields):
+        return [name for name in fields if name != 'id' and self.model._meta.get_field(name).is_relation]
+
+    def get_version(self, version):
+        """The version of a response whose data has this version, which also changes with the names of any related objects it shows"""
+
+        if self.get_related_fields(self.get_fields()):
+            return max(version, get_related_labels_version())
+        return version
+
+    def get_body(self):
+        try:
+            body = json.loads(self.request.body or b'{}')
+        except ValueError:
+            raise APIError('The request body is not valid JSON')
+        if not isinstance(body, dict):
+            raise APIError('The request body must be a JSON object')
+        return body
+
+    def get_form(self, writable_fields, data, instance=None):
+        form_class = modelform_factory(self.model, fields=writable_fields)
+        form = form_class(data, instance=instance)
+        if not form.is_valid():
+            raise APIError('The data is not valid', errors=form.errors.get_json_data())
+        return form
+
+    def conditional_response(self, etag, last_modified=None):
+        """A 304 response if the client's copy is current, or None"""
+
+        return get_conditional_response(
+            self.request,
+            etag=etag,
+            last_modified=last_modified and int(last_modified.timestamp()),
+        )
+
+    def set_validators(self, response, etag, last_modified=None):
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified.timestamp())
+        return response
+
+    def get_etag(self, *parts):
+        signature = '|'.join(str(part) for part in parts + (self.request.get_full_path(),))
+        return f'"{hashlib.md5(signature.encode()).hexdigest()}"'
+
+
+class CursorListMixin:
+    """Lists a queryset a page at a time with the after and before cursors of KeysetPaginator"""
+
+    ordering = ['-when', '-pk']
+    default_limit = 50
+    max_limit = 200
+
+    def get_limit(self):
+        try:
+            return max(1, min(int(self.request.GET.get('limit', self.default_limit)), self.max_limit))
+        except ValueError:
+            raise APIError('limit must be a number')
+
+    def get_page_url(self, **cursor):
+        params = self.request.GET.copy()
+        params.pop('after', None)
+        params.pop('before', None)
+        params.update(cursor)
+        return self.request.build_absolute_uri(f'{self.request.path}?{params.urlencode()}')
+
+    def render_page(self, queryset, fields):
+        paginator = KeysetPaginator(queryset, self.get_limit(), self.ordering)
+        try:
+            page = paginator.page(after=self.request.GET.get('after'), before=self.request.GET.get('before'))
+        except InvalidPage as error:
+            raise APIError(str(error))
+
+        return JsonResponse({
+            'results': [serialize(obj, fields) for obj in page],
+            'next': self.get_page_url(after=page.next_cursor) if page.next_cursor else None,
+            'previous': self.get_page_url(before=page.previous_cursor) if page.previous_cursor else None,
+        })
+
+
+class TicketListAPI(CursorListMixin, APIView):
+    """List tickets, newest first, or create a ticket
+
+    The list can be filtered with is_resolved, technician and urgency.  The
+    ETag and Last-Modified change whenever any ticket or note changes
+
+    """
+
+    model = Ticket
+    fields = TICKET_FIELDS
+    method_permissions = {'post': 'add'}
+
+    def get(self, request, *args, **kwargs):
+
+        version = self.get_version(Ticket.get_list_cache_version())
+        etag = self.get_etag(version)
+        last_modified = version_to_datetime(version)
+        not_modified = self.conditional_response(etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        fields = self.get_fields()
+        queryset = Ticket.objects.select_related(*self.get_related_fields(fields))
+        for name in ['technician', 'urgency']:
+            if name in request.GET:
+                try:
+                    queryset = queryset.filter(**{name: int(request.GET[name]) if request.GET[name] else None})
+                except ValueError:
+                    raise APIError(f'{name} must be a number')
+        if 'is_resolved' in request.GET:
+            queryset = queryset.filter(is_resolved=request.GET['is_resolved'].lower() in ['1', 'true', 'yes'])
+
+        return self.set_validators(self.render_page(queryset, fields), etag, last_modified)
+
+    def post(self, request, *args, **kwargs):
+
+        body = self.get_body()
+        data = model_to_dict(Ticket(), TICKET_WRITABLE_FIELDS)
+        # as on the ticket form, the technicians and the submitter are emailed unless the body says otherwise
+        data['recipient_emails'] = get_default_recipient_emails(request.user)
+        data.update(body)
+        form = self.get_form(TICKET_WRITABLE_FIELDS, data)
+
+        with transaction.atomic():
+            ticket = form.save(commit=False)
+            ticket.submitted_by = request.user
+            ticket.save()
+            History.objects.bulk_create(get_history(form, 'ticket', ticket, request.user))
+            if not body.get('donot_send'):
+                send_ticket_mail(ticket, request, is_new=True)
+
+        return JsonResponse(serialize(ticket, TICKET_FIELDS), status=201)
+
+
+class TicketChangesAPI(APIView):
+    """The tickets changed since a cursor, oldest change first, for pollers
+
+    Without since, returns the earliest changes.  Each response carries the
+    cursor to pass as since next time, which is the same cursor if nothing
+    changed.  A change to a ticket's notes counts as a change to the ticket.
+    Deleted tickets are not listed.  Changes from the last
+    LIBTEKTICKET_CHANGES_LAG seconds are held back, because updated_at is
+    set when a ticket is saved but only seen once its transaction commits,
+    which could otherwise put it behind a cursor already handed out
+
+    """
+
+    model = Ticket
+    fields = TICKET_FIELDS
+    ordering = ['updated_at', 'pk']
+    default_limit = 100
+    max_limit = 500
+
+    def get(self, request, *args, **kwargs):
+
+        lag = timedelta(seconds=getattr(settings, 'LIBTEKTICKET_CHANGES_LAG', 5))
+        cutoff = timezone.now() - lag
+        version = self.get_version(Ticket.get_list_cache_version())
+        etag = self.get_etag(version)
+        changed = version_to_datetime(version)
+        if not settings.USE_TZ:
+            # timezone.now(), and so the cutoff, is naive
+            changed = timezone.make_naive(changed)
+        # held back changes appear without the version changing, so only a settled list can be not modified
+        if changed <= cutoff:
+            not_modified = self.conditional_response(etag)
+            if not_modified is not None:
+                return not_modified
+
+        try:
+            limit = max(1, min(int(request.GET.get('limit', self.default_limit)), self.max_limit))
+        except ValueError:
+            raise APIError('limit must be a number')
+
+        fields = self.get_fields()
+        queryset = Ticket.objects.select_related(*self.get_related_fields(fields)).filter(
+            updated_at__lte=cutoff,
+        )
+        paginator = KeysetPaginator(queryset, limit, self.ordering)
+        since = request.GET.get('since', '')
+        try:
+            page = paginator.page(after=since)
+        except InvalidPage as error:
+            raise APIError(str(error))
+
+        response = JsonResponse({
+            'results': [serialize(ticket, fields) for ticket in page],
+            'since': paginator.encode_cursor(page.object_list[-1]) if page.object_list else since,
+            'more': page.has_next(),
+        })
+        if page.object_list:
+            response['Last-Modified'] = http_date(page.object_list[-1].updated_at.timestamp())
+        response['ETag'] = etag
+        return response
+
+
+class TicketDetailAPI(APIView):
+    """Get, change (with PATCH) or delete one ticket
+
+    The ETag and Last-Modified change whenever the ticket or one of its notes changes
+
+    """
+
+    model = Ticket
+    fields = TICKET_FIELDS
+    method_permissions = {'patch': 'change', 'delete': 'delete'}
+
+    def get_object(self, queryset=None):
+        if queryset is None:
+            queryset = Ticket.objects.all()
+        ticket = queryset.filter(pk=self.kwargs['pk']).first()
+        if ticket is None:
+            raise Http404('No ticket found')
+        return ticket
+
+    def get(self, request, *args, **kwargs):
+
+        # the version is read before the ticket so a change in between gives the older version, and the ticket
+        # is fetched before answering 304 so a deleted ticket is not found
+        version = self.get_version(Ticket(pk=self.kwargs['pk']).get_cache_version())
+        fields = self.get_fields()
+        ticket = self.get_object(Ticket.objects.select_related(*self.get_related_fields(fields)))
+        etag = self.get_etag(version)
+        last_modified = version_to_datetime(version)
+        not_modified = self.conditional_response(etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        return self.set_validators(JsonResponse(serialize(ticket, fields)), etag, last_modified)
+
+    def patch(self, request, *args, **kwargs):
+
+        ticket = self.get_object()
+        body = self.get_body()
+        data = model_to_dict(ticket, TICKET_WRITABLE_FIELDS)
+        data.update(body)
+        form = self.get_form(TICKET_WRITABLE_FIELDS, data, instance=ticket)
+
+        with transaction.atomic():
+            ticket = form.save(commit=False)
+            ticket.save(update_fields=Ticket.get_form_update_fields(form))
+            form.save_m2m()
+            History.objects.bulk_create(get_history(form, 'ticket', ticket, request.user))
+            if form.changed_data and not body.get('donot_send'):
+                send_ticket_mail(ticket, request, changes=describe_changes(form))
+
+        return JsonResponse(serialize(ticket, TICKET_FIELDS))
+
+    def delete(self, request, *args, **kwargs):
+
+        self.get_object().delete()
+        return HttpResponse(status=204)
+
+
+class TicketNoteListAPI(CursorListMixin, APIView):
+    """List the notes of a ticket, newest first, or add a note to it"""
+
+    model = TicketNote
+    fields = TICKETNOTE_FIELDS
+    method_permissions = {'post': 'add'}
+
+    def get_ticket(self):
+        ticket = Ticket.objects.filter(pk=self.kwargs['ticketpk']).first()
+        if ticket is None:
+            raise Http404('No ticket found')
+        return ticket
+
+    def get(self, request, *args, **kwargs):
+
+        version = self.get_version(Ticket(pk=self.kwargs['ticketpk']).get_cache_version())
+        ticket = self.get_ticket()
+        etag = self.get_etag(version)
+        last_modified = version_to_datetime(version)
+        not_modified = self.conditional_response(etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        fields = self.get_fields()
+        queryset = ticket.ticketnote_set.select_related(*self.get_related_fields(fields))
+        return self.set_validators(self.render_page(queryset, fields), etag, last_modified)
+
+    def post(self, request, *args, **kwargs):
+
+        ticket = self.get_ticket()
+        body = self.get_body()
+        data = model_to_dict(TicketNote(), TICKETNOTE_WRITABLE_FIELDS)
+        data.update(body)
+        form = self.get_form(TICKETNOTE_WRITABLE_FIELDS, data)
+
+        with transaction.atomic():
+            note = form.save(commit=False)
+            note.ticket = ticket
+            note.submitted_by = request.user
+            note.save()
+            History.objects.bulk_create(get_history(form, 'ticketnote', note, request.user))
+            if not body.get('donot_send'):
+                send_ticket_mail(ticket, request, changes=[f'Note added: {note.maintext}'])
+
+        return JsonResponse(serialize(note, TICKETNOTE_FIELDS), status=201)
+
+
+class TicketNoteDetailAPI(APIView):
+    """Get, change (with PATCH) or delete one note of a ticket
+
+    The ETag and Last-Modified change whenever the ticket or one of its notes changes
+
+    """
+
+    model = TicketNote
+    fields = TICKETNOTE_FIELDS
+    method_permissions = {'patch': 'change', 'delete': 'delete'}
+
+    def get_object(self, queryset=None):
+        if queryset is None:
+            queryset = TicketNote.objects.all()
+        note = queryset.filter(pk=self.kwargs['pk'], ticket_id=self.kwargs['ticketpk']).first()
+        if note is None:
+            raise Http404('No note found')
+        return note
+
+    def get(self, request, *args, **kwargs):
+
+        version = self.get_version(Ticket(pk=self.kwargs['ticketpk']).get_cache_version())
+        fields = self.get_fields()
+        note = self.get_object(TicketNote.objects.select_related(*self.get_related_fields(fields)))
+        etag = self.get_etag(version)
+        last_modified = version_to_datetime(version)
+        not_modified = self.conditional_response(etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        return self.set_validators(JsonResponse(serialize(note, fields)), etag, last_modified)
+
+    def patch(self, request, *args, **kwargs):
+
+        note = self.get_object()
+        body = self.get_body()
+        data = model_to_dict(note, TICKETNOTE_WRITABLE_FIELDS)
+        data.update(body)
+        form = self.get_form(TICKETNOTE_WRITABLE_FIELDS, data, instance=note)
+
+        with transaction.atomic():
+            note = form.save()
+            History.objects.bulk_create(get_history(form, 'ticketnote', note, request.user))
+            if form.changed_data and not body.get('donot_send'):
+                send_ticket_mail(note.ticket, request, changes=[f'Note changed: {note.maintext}'])
+
+        return JsonResponse(serialize(note, TICKETNOTE_FIELDS))
+
+    def delete(self, request, *args, **kwargs):
+
+        note = self.get_object()
+        body = self.get_body()
+        with transaction.atomic():
+            note.delete()
+            if not body.get('donot_send'):
+                send_ticket_mail(note.ticket, request, changes=[f'Note deleted: {note.maintext}'])
+        return HttpResponse(status=204)
+
+
+class TechnicianListAPI(APIView):
+    """List the technicians, or create a technician.  Pass is_current=1 for current technicians only"""
+
+    model = Technician
+    fields = TECHNICIAN_FIELDS
+    method_permissions = {'post': 'add'}
+
+    def get(self, request, *args, **kwargs):
+
+        fields = self.get_fields()
+        queryset = Technician.objects.select_related(*self.get_related_fields(fields)).order_by('name', 'pk')
+        if request.GET.get('is_current', '').lower() in ['1', 'true', 'yes']:
+            queryset = queryset.filter(is_current=True)
+
+        content = json.dumps({'results': [serialize(technician, fields) for technician in queryset]})
+        etag = f'"{hashlib.md5(content.encode()).hexdigest()}"'
+        not_modified = self.conditional_response(etag)
+        if not_modified is not None:
+            return not_modified
+
+        return self.set_validators(HttpResponse(content, content_type='application/json'), etag)
+
+    def post(self, request, *args, **kwargs):
+
+        data = model_to_dict(Technician(), TECHNICIAN_WRITABLE_FIELDS)
+        data.update(self.get_body())
+        technician = self.get_form(TECHNICIAN_WRITABLE_FIELDS, data).save()
+        return JsonResponse(serialize(technician, TECHNICIAN_FIELDS), status=201)
+
+
+class TechnicianDetailAPI(APIView):
+    """Get, change (with PATCH) or delete one technician"""
+
+    model = Technician
+    fields = TECHNICIAN_FIELDS
+    method_permissions = {'patch': 'change', 'delete': 'delete'}
+
+    def get_object(self, queryset=None):
+        if queryset is None:
+            queryset = Technician.objects.all()
+        technician = queryset.filter(pk=self.kwargs['pk']).first()
+        if technician is None:
+            raise Http404('No technician found')
+        return technician
+
+    def get(self, request, *args, **kwargs):
+
+        fields = self.get_fields()
+        technician = self.get_object(Technician.objects.select_related(*self.get_related_fields(fields)))
+        return JsonResponse(serialize(technician, fields))
+
+    def patch(self, request, *args, **kwargs):
+
+        technician = self.get_object()
+        data = model_to_dict(technician, TECHNICIAN_WRITABLE_FIELDS)
+        data.update(self.get_body())
+        technician = self.get_form(TECHNICIAN_WRITABLE_FIELDS, data, instance=technician).save()
+        return JsonResponse(serialize(technician, TECHNICIAN_FIELDS))
+
+    def delete(self, request, *args, **kwargs):
+
+        self.get_object().delete()
+        return HttpResponse(status=204)
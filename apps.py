@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class LibtekticketConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'libtekticket'
+
+    def ready(self):
+        from . import signals
@@ -0,0 +1,172 @@
+import asyncio
+import itertools
+import json
+import threading
+import time
+from collections import deque
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+TICKET_CREATED = 'ticket_created'
+TICKET_UPDATED = 'ticket_updated'
+NOTE_ADDED = 'note_added'
+
+
+class InProcessBackend:
+    """Keeps recent events in memory and wakes the waiting clients of this process
+
+    Only clients connected to the process that published an event see it, so
+    use this with a single server process, or use CacheBackend
+
+    """
+
+    def __init__(self, max_events=1000):
+        self.events = deque(maxlen=max_events)
+        self.ids = itertools.count(1)
+        self.condition = threading.Condition()
+        self.async_waiters = set()
+
+    def publish(self, event):
+        with self.condition:
+            event = dict(event, id=next(self.ids))
+            self.events.append(event)
+            self.condition.notify_all()
+            waiters = list(self.async_waiters)
+        for loop, waiter in waiters:
+            loop.call_soon_threadsafe(waiter.set)
+        return event
+
+    def last_id(self):
+        with self.condition:
+            return self.events[-1]['id'] if self.events else 0
+
+    def get_start(self, after):
+        """after, or 0 if it is past the last id because the ids started again when the process restarted"""
+
+        return 0 if after > self.last_id() else after
+
+    def since(self, after):
+        after = self.get_start(after)
+        with self.condition:
+            return [event for event in self.events if event['id'] > after]
+
+    def wait(self, after, timeout):
+        """The events after the id after, waiting up to timeout seconds for one"""
+
+        after = self.get_start(after)
+        with self.condition:
+            self.condition.wait_for(lambda: self.events and self.events[-1]['id'] > after, timeout)
+        return self.since(after)
+
+    async def wait_async(self, after, timeout):
+        after = self.get_start(after)
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        with self.condition:
+            self.async_waiters.add(waiter)
+        try:
+            if not self.since(after):
+                try:
+                    await asyncio.wait_for(waiter[1].wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+            return self.since(after)
+        finally:
+            with self.condition:
+                self.async_waiters.discard(waiter)
+
+
+class CacheBackend:
+    """Keeps recent events in Django's cache, so every process sharing the cache sees them
+
+    Waiting clients check the cache every poll_interval seconds
+
+    """
+
+    counter_key = 'libtekticket_event_counter'
+    event_key = 'libtekticket_event_{}'
+
+    def __init__(self, max_events=1000, poll_interval=1, timeout=3600):
+        self.max_events = max_events
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+
+    def publish(self, event):
+        cache.add(self.counter_key, 0, None)
+        event = dict(event, id=cache.incr(self.counter_key))
+        cache.set(self.event_key.format(event['id']), event, self.timeout)
+        return event
+
+    def last_id(self):
+        return cache.get(self.counter_key, 0)
+
+    def get_start(self, after):
+        """after, or 0 if it is past the last id because the counter was evicted and started again"""
+
+        return 0 if after > self.last_id() else after
+
+    def since(self, after):
+        last_id = self.last_id()
+        if after > last_id:
+            after = 0
+        after = max(after, last_id - self.max_events)
+        if last_id <= after:
+            return []
+        keys = [self.event_key.format(event_id) for event_id in range(after + 1, last_id + 1)]
+        found = cache.get_many(keys)
+        return [found[key] for key in keys if key in found]
+
+    def wait(self, after, timeout):
+        after = self.get_start(after)
+        deadline = time.monotonic() + timeout
+        while True:
+            events = self.since(after)
+            if events or time.monotonic() >= deadline:
+                return events
+            time.sleep(min(self.poll_interval, max(deadline - time.monotonic(), 0)))
+
+    async def wait_async(self, after, timeout):
+        after = self.get_start(after)
+        deadline = time.monotonic() + timeout
+        while True:
+            events = self.since(after)
+            if events or time.monotonic() >= deadline:
+                return events
+            await asyncio.sleep(min(self.poll_interval, max(deadline - time.monotonic(), 0)))
+
+
+@lru_cache(maxsize=None)
+def get_backend():
+    """The event backend named by LIBTEKTICKET_EVENT_BACKEND, created once per process"""
+
+    return import_string(getattr(settings, 'LIBTEKTICKET_EVENT_BACKEND', 'libtekticket.events.InProcessBackend'))()
+
+
+def publish(kind, ticket, **data):
+    """Send an event about a ticket to the connected clients once the current transaction commits
+
+    Args:
+        kind: TICKET_CREATED, TICKET_UPDATED or NOTE_ADDED
+        ticket: The ticket the event is about
+        data: More values to include in the event
+
+    """
+
+    event = {
+        'kind': kind,
+        'ticket': ticket.pk,
+        'short_description': ticket.short_description,
+        'urgency': ticket.urgency,
+        'is_resolved': ticket.is_resolved,
+        **data,
+    }
+    transaction.on_commit(lambda: get_backend().publish(event))
+
+
+def format_event(event):
+    """An event in the text/event-stream format"""
+
+    return f"id: {event['id']}\nevent: {event['kind']}\ndata: {json.dumps(event)}\n\n"
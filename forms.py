@@ -1,6 +1,66 @@
 from django import forms
+from django.conf import settings
+from django.core.cache import cache
 from django.forms import inlineformset_factory
-from .models import Ticket, TicketNote
+from django.urls import reverse_lazy
+from libtekin.models import Item
+from .models import Technician, Ticket, TicketNote
+
+
+ITEM_CHOICES_CACHE_KEY = 'libtekticket_item_choices'
+
+
+class ItemChoiceValue:
+    """The value of an item option, carrying the data ItemSelect adds to the option"""
+
+    def __init__(self, pk, home, textforfilter):
+        self.pk = pk
+        self.home = home
+        self.textforfilter = textforfilter
+
+    def __str__(self):
+        return str(self.pk)
+
+    def __eq__(self, other):
+        if isinstance(other, ItemChoiceValue):
+            other = other.pk
+        return self.pk == other
+
+    def __hash__(self):
+        return hash(self.pk)
+
+
+def get_item_choice(item):
+    """The (pk, label, home pk, filter text) of an item, with home and assignee already fetched"""
+
+    textforfilter = f"{item.primary_id}"
+    if item.home is not None:
+        textforfilter = textforfilter + f"|{item.home.short_name}|{item.home.full_name}"
+    if item.assignee is not None:
+        textforfilter = textforfilter + f"|{item.assignee.friendly_name}|{item.assignee.full_name}"
+
+    return (item.pk, str(item), item.home_id, textforfilter)
+
+
+def get_item_choices():
+    """A list of (pk, label, home pk, filter text) for every item
+
+    Built with one query and cached until an item, location or assignee
+    is saved or deleted
+
+    """
+
+    item_choices = cache.get(ITEM_CHOICES_CACHE_KEY)
+    if item_choices is None:
+        item_choices = [get_item_choice(item) for item in Item.objects.select_related('home', 'assignee')]
+
+        cache.set(ITEM_CHOICES_CACHE_KEY, item_choices, getattr(settings, 'LIBTEKTICKET_ITEM_CHOICES_TIMEOUT', 3600))
+
+    return item_choices
+
+
+def clear_item_choices():
+    cache.delete(ITEM_CHOICES_CACHE_KEY)
 
 
 class ItemSelect(forms.Select):
@@ -11,27 +71,58 @@ class ItemSelect(forms.Select):
             name, value, label, selected, index, subindex, attrs
         )
         if value:
-            textforfilter = f"{name}|{value.instance.primary_id}"
-            if value.instance.location is not None:
-                option["attrs"]["data-home"] = value.instance.home.pk
-                textforfilter = (
-                    textforfilter
-                    + f"|{value.instance.home.short_name}|{value.instance.home.full_name}"
-                )
-
-            if value.instance.assignee is not None:
-                textforfilter = (
-                    textforfilter
-                    + f"|{value.instance.assignee.friendly_name}|{value.instance.assignee.full_name}"
-                )
-                option["attrs"]["data-textforfilter"] = textforfilter
+            option["attrs"]["data-textforfilter"] = f"{name}|{value.textforfilter}"
+            if value.home is not None:
+                option["attrs"]["data-home"] = value.home
 
         return option
 
 
+class ItemSearchSelect(ItemSelect):
+    """An ItemSelect that renders only the chosen item
+
+    The page script loads other items from the item search url as the user
+    types, so the size of the form doesn't depend on the number of items
+
+    """
+
+    def __init__(self, attrs=None, choices=()):
+        attrs = {**(attrs or {}), "data-search-url": reverse_lazy("libtekticket:item-search")}
+        super().__init__(attrs, choices)
+
+
 class TicketForm(forms.ModelForm):
     def __init__(self, **kwargs):
-        return super().__init__(**kwargs)
+        super().__init__(**kwargs)
+
+        self.item_search = getattr(settings, "LIBTEKTICKET_ITEM_SEARCH", False)
+
+        # choices are not read from the queryset, which is still used to validate the submitted item
+        if self.item_search:
+            self.fields["item"].widget = ItemSearchSelect()
+            item_choices = self.get_selected_item_choices()
+        else:
+            item_choices = get_item_choices()
+
+        self.fields["item"].choices = [("", self.fields["item"].empty_label)] + [
+            (ItemChoiceValue(pk, home, textforfilter), label)
+            for pk, label, home, textforfilter in item_choices
+        ]
+
+    def get_selected_item_choices(self):
+        """The choice for the item currently in the form, if any"""
+
+        if self.is_bound:
+            value = self.data.get(self.add_prefix("item"))
+        else:
+            value = self.initial.get("item")
+
+        try:
+            items = Item.objects.select_related("home", "assignee").filter(pk=int(value))
+        except (TypeError, ValueError):
+            return []
+
+        return [get_item_choice(item) for item in items]
 
     class Meta:
         model = Ticket
@@ -77,6 +168,79 @@ class CSVOptionForm(forms.Form):
     )
 
 
+class TicketBulkForm(forms.Form):
+
+    ACTION_CHOICES = (
+        ('assign', 'assign technician'),
+        ('urgency', 'set urgency'),
+        ('resolve', 'mark resolved'),
+    )
+
+    tickets = forms.ModelMultipleChoiceField(
+        queryset=Ticket.objects.only('pk'),
+        help_text="The tickets to change",
+    )
+    action = forms.ChoiceField(
+        choices=ACTION_CHOICES,
+        help_text="The change to make to every chosen ticket",
+    )
+    technician = forms.ModelChoiceField(
+        queryset=Technician.objects.filter(is_current=True),
+        required=False,
+        help_text="The technician to assign",
+    )
+    urgency = forms.TypedChoiceField(
+        choices=Ticket.URGENCY_CHOICES,
+        coerce=int,
+        required=False,
+        help_text="The urgency to set",
+    )
+    donot_send = forms.BooleanField(
+        label="don't send",
+        required=False,
+        help_text="Don't email the tickets' recipients about this change",
+    )
+
+    def clean(self):
+        cleaned_data = super().clean()
+        action = cleaned_data.get('action')
+        if action == 'assign' and cleaned_data.get('technician') is None:
+            self.add_error('technician', 'Choose a technician to assign')
+        if action == 'urgency' and not cleaned_data.get('urgency'):
+            self.add_error('urgency', 'Choose an urgency to set')
+        return cleaned_data
+
+    def get_changes(self):
+        """The ticket fields to update and their new values"""
+
+        action = self.cleaned_data['action']
+        if action == 'assign':
+            return {'technician': self.cleaned_data['technician']}
+        if action == 'urgency':
+            return {'urgency': self.cleaned_data['urgency']}
+        return {'is_resolved': True}
+
+
+class MetricsForm(forms.Form):
+
+    start = forms.DateField(
+        required=False,
+        widget=forms.DateInput(attrs={'type': 'date'}),
+        help_text="The first day to include.  Defaults to 30 days ago",
+    )
+    end = forms.DateField(
+        required=False,
+        widget=forms.DateInput(attrs={'type': 'date'}),
+        help_text="The last day to include.  Defaults to today",
+    )
+    group_by = forms.ChoiceField(
+        label="group by",
+        choices=[('technician', 'technician'), ('location', 'location'), ('urgency', 'urgency')],
+        initial='technician',
+        required=False,
+    )
+
+
 TicketTicketNoteFormset = inlineformset_factory(
-    Ticket, TicketNote, form=TicketTicketNoteForm, extra=10
+    Ticket, TicketNote, form=TicketTicketNoteForm, extra=0
 )
@@ -0,0 +1,179 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import connection as db_connection
+from django.db import transaction
+from django.utils import timezone
+
+from .models import OutboundMail
+
+
+def enqueue_mail(subject, message, from_email, recipient_list, html_message='', ticket=None, changes=None, delay=None):
+    """Queue an email to be sent by the libtekticket_sendmail command
+
+    Args:
+        subject: The subject of the email
+        message: The plain text body
+        from_email: The sender address
+        recipient_list: A list of recipient addresses
+        html_message: An optional HTML body
+        ticket: The ticket the email is about, if any
+        changes: A list of the changes described by the email
+        delay: An optional timedelta to hold the email before it is sent
+
+    """
+
+    next_attempt = timezone.now()
+    if delay:
+        next_attempt = next_attempt + delay
+
+    return OutboundMail.objects.create(
+        subject=subject,
+        message=message,
+        html_message=html_message or '',
+        from_email=from_email,
+        recipients=','.join(recipient_list),
+        ticket=ticket,
+        changes='\n'.join(changes or []),
+        next_attempt=next_attempt,
+    )
+
+
+def get_digest_window():
+    """The time ticket updates are held so later updates can join them"""
+
+    return timedelta(seconds=getattr(settings, 'LIBTEKTICKET_MAIL_DIGEST_WINDOW', 120))
+
+
+def get_pending_digest(ticket):
+    """The queued update email for a ticket that is still being held, if any
+
+    Must be called inside a transaction.  The row is locked so the
+    libtekticket_sendmail command can't send it while it is being changed
+
+    """
+
+    return OutboundMail.objects.select_for_update().filter(
+        ticket=ticket,
+        status=OutboundMail.STATUS_QUEUED,
+        attempts=0,
+        next_attempt__gt=timezone.now(),
+    ).order_by('-next_attempt').first()
+
+
+def get_retry_delay(attempts):
+    """The time to wait before the next attempt, doubling with each failure"""
+
+    base = getattr(settings, 'LIBTEKTICKET_MAIL_RETRY_DELAY', 60)
+    return timedelta(seconds=base * 2 ** max(attempts - 1, 0))
+
+
+def record_failure(mail, error):
+
+    max_attempts = getattr(settings, 'LIBTEKTICKET_MAIL_MAX_ATTEMPTS', 5)
+
+    mail.attempts = mail.attempts + 1
+    mail.last_error = str(error)
+    if mail.attempts >= max_attempts:
+        mail.status = OutboundMail.STATUS_DEAD
+    else:
+        mail.status = OutboundMail.STATUS_QUEUED
+        mail.next_attempt = timezone.now() + get_retry_delay(mail.attempts)
+
+
+def claim_queued_mail(batch_size):
+    """Mark a batch of due mail as being sent, so no other run or digest update touches it
+
+    The rows are claimed in a short transaction so that no lock is held
+    while talking to the mail server.  Mail left in sending by a run that
+    stopped part way is claimed again once LIBTEKTICKET_MAIL_SEND_TIMEOUT
+    seconds (default 600) have passed
+
+    """
+
+    now = timezone.now()
+    with transaction.atomic():
+        batch = list(
+            OutboundMail.objects.select_for_update(
+                skip_locked=db_connection.features.has_select_for_update_skip_locked
+            ).filter(
+                status__in=[OutboundMail.STATUS_QUEUED, OutboundMail.STATUS_SENDING],
+                next_attempt__lte=now
+            )[:batch_size]
+        )
+        if batch:
+            OutboundMail.objects.filter(pk__in=[mail.pk for mail in batch]).update(
+                status=OutboundMail.STATUS_SENDING,
+                next_attempt=now + timedelta(seconds=getattr(settings, 'LIBTEKTICKET_MAIL_SEND_TIMEOUT', 600)),
+            )
+    return batch
+
+
+def send_queued_mail(batch_size=None, connection=None):
+    """Send one batch of due mail over a single mail connection
+
+    Mail that fails is retried with an increasing delay until
+    LIBTEKTICKET_MAIL_MAX_ATTEMPTS is reached, after which it is marked dead
+    and left in the table for inspection.  The result of each message is
+    saved as soon as it is known, outside of any transaction, so an error
+    part way through a batch does not undo the record of mail already sent
+
+    Args:
+        batch_size: The most messages to send.  Defaults to LIBTEKTICKET_MAIL_BATCH_SIZE or 50
+        connection: A mail connection.  Defaults to get_connection()
+
+    Returns:
+        A tuple of the number of messages sent and the number that failed
+
+    """
+
+    if batch_size is None:
+        batch_size = getattr(settings, 'LIBTEKTICKET_MAIL_BATCH_SIZE', 50)
+
+    sent = 0
+    failed = 0
+    result_fields = ['status', 'attempts', 'last_error', 'next_attempt', 'sent_when']
+
+    batch = claim_queued_mail(batch_size)
+    if not batch:
+        return sent, failed
+
+    if connection is None:
+        connection = get_connection()
+
+    try:
+        connection.open()
+    except Exception as e:
+        for mail in batch:
+            record_failure(mail, e)
+            mail.save(update_fields=result_fields)
+        return sent, len(batch)
+
+    try:
+        for mail in batch:
+            message = EmailMultiAlternatives(
+                mail.subject,
+                mail.message,
+                mail.from_email,
+                mail.get_recipient_list(),
+                connection=connection,
+            )
+            if mail.html_message:
+                message.attach_alternative(mail.html_message, 'text/html')
+
+            try:
+                message.send()
+            except Exception as e:
+                record_failure(mail, e)
+                failed = failed + 1
+            else:
+                mail.status = OutboundMail.STATUS_SENT
+                mail.sent_when = timezone.now()
+                sent = sent + 1
+
+            mail.save(update_fields=result_fields)
+    finally:
+        connection.close()
+
+    return sent, failed
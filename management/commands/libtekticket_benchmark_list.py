@@ -0,0 +1,100 @@
+import random
+import time
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from libtekticket.models import Ticket
+
+
+class Command(BaseCommand):
+    help = (
+        'Time the default ticket list query with and without the list index. '
+        'The test tickets are created inside a transaction which is rolled back, '
+        'so the database is left unchanged'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tickets',
+            type=int,
+            default=100000,
+            help='The number of test tickets to create',
+        )
+        parser.add_argument(
+            '--unresolved',
+            type=float,
+            default=0.1,
+            help='The fraction of test tickets that are unresolved',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=10,
+            help='The number of times each query is run',
+        )
+
+    def handle(self, *args, **options):
+
+        if not connection.features.can_rollback_ddl:
+            raise CommandError('The database must support transactional DDL so the index can be restored')
+
+        index = next(index for index in Ticket._meta.indexes if index.name == 'ticket_list_idx')
+
+        with transaction.atomic():
+            self.make_tickets(options['tickets'], options['unresolved'])
+
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+            with_index = self.time_list(options['repeat'])
+
+            with connection.cursor() as cursor:
+                cursor.execute(str(index.remove_sql(Ticket, connection.schema_editor())))
+
+            without_index = self.time_list(options['repeat'])
+
+            transaction.set_rollback(True)
+
+        self.stdout.write(f"{ options['tickets'] } tickets, { options['repeat'] } runs, median milliseconds")
+        self.stdout.write(f"{ 'query':<12}{ 'with index':>14}{ 'without':>14}")
+        for name in with_index:
+            self.stdout.write(f"{ name:<12}{ with_index[name]:>14.2f}{ without_index[name]:>14.2f}")
+
+    def make_tickets(self, count, unresolved):
+
+        start = datetime.now()
+        batch = []
+        for number in range(count):
+            batch.append(Ticket(
+                short_description=f'Benchmark ticket {number}',
+                urgency=random.randint(1, 5),
+                is_resolved=random.random() >= unresolved,
+                when=start - timedelta(minutes=random.randint(0, 60 * 24 * 365 * 5)),
+            ))
+            if len(batch) >= 5000:
+                Ticket.objects.bulk_create(batch)
+                batch = []
+        Ticket.objects.bulk_create(batch)
+
+    def time_list(self, repeat):
+        """The median times of the queries made by the first and a deep page of the default ticket list"""
+
+        queryset = Ticket.objects.filter(is_resolved=False)
+        queries = {
+            'count': lambda: queryset.count(),
+            'first page': lambda: list(queryset[:30]),
+            'page 100': lambda: list(queryset[2970:3000]),
+        }
+
+        timings = {}
+        for name, query in queries.items():
+            runs = []
+            for run in range(repeat):
+                began = time.perf_counter()
+                query()
+                runs.append((time.perf_counter() - began) * 1000)
+            timings[name] = sorted(runs)[len(runs) // 2]
+
+        return timings
@@ -0,0 +1,27 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from libtekticket.models import APIToken
+
+
+class Command(BaseCommand):
+    help = (
+        'Create an API token for a user and print its key, which is not stored and cannot be shown again. '
+        'Clients send it as "Authorization: Token <key>"'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('username', help='The user whose permissions the token has')
+        parser.add_argument('--name', default='', help='What uses the token, such as a kiosk')
+
+    def handle(self, *args, **options):
+
+        user_model = get_user_model()
+        try:
+            user = user_model.objects.get(**{user_model.USERNAME_FIELD: options['username']})
+        except user_model.DoesNotExist:
+            raise CommandError(f"No user named { options['username'] }")
+
+        token, key = APIToken.objects.create_token(user, options['name'])
+
+        self.stdout.write(key)
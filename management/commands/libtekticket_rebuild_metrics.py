@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from libtekticket import metrics
+from libtekticket.models import TicketBacklog, TicketDailyStats
+
+
+class Command(BaseCommand):
+    help = 'Recalculate the daily ticket metrics and the open ticket backlog from every ticket'
+
+    def handle(self, *args, **options):
+
+        metrics.rebuild()
+
+        self.stdout.write(f'{ TicketDailyStats.objects.count() } daily rows, { TicketBacklog.objects.count() } backlog rows')
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from libtekticket.search import get_backend, rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the ticket search text from the tickets and their notes'
+
+    def handle(self, *args, **options):
+
+        rebuild_index()
+
+        self.stdout.write(f"search index rebuilt using { get_backend() or 'LIKE matching' }")
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from libtekticket.models import Ticket
+
+
+class Command(BaseCommand):
+    help = "Recalculate each ticket's note count and last activity from its notes"
+
+    def handle(self, *args, **options):
+
+        updated = Ticket.objects.all().refresh_summaries()
+
+        self.stdout.write(f'{ updated } tickets updated')
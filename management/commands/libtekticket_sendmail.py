@@ -0,0 +1,48 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from libtekticket.mailqueue import send_queued_mail
+
+
+class Command(BaseCommand):
+    help = 'Send the ticket emails waiting in the outbound mail queue'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=getattr(settings, 'LIBTEKTICKET_MAIL_BATCH_SIZE', 50),
+            help='The most emails to send over one mail server connection',
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep running and check the queue every --interval seconds',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=10,
+            help='The number of seconds to wait between checks when --loop is given',
+        )
+
+    def handle(self, *args, **options):
+
+        batch_size = options['batch_size']
+
+        while True:
+            sent, failed = send_queued_mail(batch_size=batch_size)
+
+            if sent or failed:
+                self.stdout.write(f'sent {sent}, failed {failed}')
+
+            # a full batch means there may be more due now
+            if sent + failed >= batch_size:
+                continue
+
+            if not options['loop']:
+                break
+
+            time.sleep(options['interval'])
@@ -0,0 +1,250 @@
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Min, Sum
+from django.utils import timezone
+
+from .models import Ticket, TicketBacklog, TicketDailyStats, TicketNote
+
+SNAPSHOT_FIELDS = ['technician_id', 'location_id', 'urgency', 'is_resolved', 'when', 'resolved_at', 'first_note_at']
+
+GROUP_FIELDS = {
+    'technician': ('technician', 'technician__name'),
+    'location': ('location', 'location__full_name'),
+    'urgency': ('urgency', 'urgency'),
+}
+
+
+def normalize(value):
+    """A datetime that is aware if USE_TZ is on and naive if it is off, so any two can be compared"""
+
+    if value is None:
+        return None
+    if settings.USE_TZ and timezone.is_naive(value):
+        return timezone.make_aware(value)
+    if not settings.USE_TZ and timezone.is_aware(value):
+        return timezone.make_naive(value)
+    return value
+
+
+def get_day(value):
+    value = normalize(value)
+    if timezone.is_aware(value):
+        value = timezone.localtime(value)
+    return value.date()
+
+
+def get_seconds(start, end):
+    return max(int((normalize(end) - normalize(start)).total_seconds()), 0)
+
+
+def get_snapshot(ticket_id):
+    """The values of a saved ticket which the metrics depend on, or None if it is not saved"""
+
+    return Ticket.objects.filter(pk=ticket_id).values(*SNAPSHOT_FIELDS).first()
+
+
+def get_values(ticket):
+    return {name: getattr(ticket, name) for name in SNAPSHOT_FIELDS}
+
+
+def get_contributions(values):
+    """What one ticket adds to the rollups, as {(model, keys): {field: amount}}"""
+
+    contributions = defaultdict(lambda: defaultdict(int))
+    if values is None:
+        return contributions
+
+    bucket = (
+        ('technician_id', values['technician_id']),
+        ('location_id', values['location_id']),
+        ('urgency', values['urgency']),
+    )
+
+    contributions[(TicketDailyStats, (('day', get_day(values['when'])),) + bucket)]['opened'] += 1
+
+    if values['resolved_at'] is not None:
+        daily = contributions[(TicketDailyStats, (('day', get_day(values['resolved_at'])),) + bucket)]
+        daily['resolved'] += 1
+        daily['resolution_seconds'] += get_seconds(values['when'], values['resolved_at'])
+
+    if values['first_note_at'] is not None:
+        daily = contributions[(TicketDailyStats, (('day', get_day(values['first_note_at'])),) + bucket)]
+        daily['first_noted'] += 1
+        daily['first_note_seconds'] += get_seconds(values['when'], values['first_note_at'])
+
+    if not values['is_resolved']:
+        contributions[(TicketBacklog, bucket)]['open_count'] += 1
+
+    return contributions
+
+
+def bump_stats(model, keys, **increments):
+    """Add increments to the rollup row for keys, creating it if there is none
+
+    Two requests creating the same row at once can leave two rows for it,
+    which is harmless because the rollups are always read with Sum
+    """
+
+    row = model.objects.filter(**keys).order_by('pk').values_list('pk', flat=True).first()
+    if row is None:
+        model.objects.create(**keys, **increments)
+    else:
+        model.objects.filter(pk=row).update(**{name: F(name) + amount for name, amount in increments.items()})
+
+
+def record_ticket_change(previous, current):
+    """Move a ticket's contribution to the rollups from its previous values to its current ones
+
+    Args:
+        previous: The ticket's snapshot before the change, or None if it is new
+        current: The ticket's snapshot after the change, or None if it was deleted
+
+    """
+
+    record_ticket_changes([(previous, current)])
+
+
+def record_ticket_changes(changes):
+    """Like record_ticket_change for many tickets, with one update per rollup row they share
+
+    Args:
+        changes: A list of (previous, current) snapshot pairs
+
+    """
+
+    deltas = defaultdict(lambda: defaultdict(int))
+    for previous, current in changes:
+        for sign, values in ((-1, previous), (1, current)):
+            for key, amounts in get_contributions(values).items():
+                for name, amount in amounts.items():
+                    deltas[key][name] += sign * amount
+
+    with transaction.atomic():
+        for (model, keys), amounts in deltas.items():
+            increments = {name: amount for name, amount in amounts.items() if amount}
+            if increments:
+                bump_stats(model, dict(keys), **increments)
+
+
+def record_ticket_deleted(previous):
+    record_ticket_change(previous, None)
+
+
+def refresh_first_note(ticket_id, when=None):
+    """Set a ticket's first_note_at after its notes change and update the rollups to match
+
+    Args:
+        ticket_id: The ticket whose notes changed
+        when: The time of a newly added note.  If not given, first_note_at is
+            recalculated from all of the ticket's notes
+
+    """
+
+    previous = get_snapshot(ticket_id)
+    if previous is None:
+        return
+
+    if when is not None:
+        first_note_at = normalize(when)
+        if previous['first_note_at'] is not None and normalize(previous['first_note_at']) <= first_note_at:
+            return
+    else:
+        first_note_at = TicketNote.objects.filter(ticket_id=ticket_id).aggregate(first=Min('when'))['first']
+
+    if first_note_at == previous['first_note_at']:
+        return
+
+    Ticket.objects.filter(pk=ticket_id).update(first_note_at=first_note_at)
+    record_ticket_change(previous, dict(previous, first_note_at=first_note_at))
+
+
+def rebuild(chunk_size=2000):
+    """Replace the rollups with totals recalculated from every ticket"""
+
+    totals = defaultdict(lambda: defaultdict(int))
+    for values in Ticket.objects.order_by().values(*SNAPSHOT_FIELDS).iterator(chunk_size=chunk_size):
+        for key, amounts in get_contributions(values).items():
+            for name, amount in amounts.items():
+                totals[key][name] += amount
+
+    with transaction.atomic():
+        TicketDailyStats.objects.all().delete()
+        TicketBacklog.objects.all().delete()
+        for model in (TicketDailyStats, TicketBacklog):
+            model.objects.bulk_create(
+                [model(**dict(keys), **amounts) for (key_model, keys), amounts in totals.items() if key_model is model],
+                batch_size=chunk_size,
+            )
+
+
+def get_default_range():
+    end = timezone.localdate() if settings.USE_TZ else datetime.now().date()
+    return end - timedelta(days=getattr(settings, 'LIBTEKTICKET_METRICS_DAYS', 30) - 1), end
+
+
+def get_hours(seconds, count):
+    return round(seconds / count / 3600, 2) if count else None
+
+
+def get_summary(start=None, end=None, group_by='technician'):
+    """Ticket counts and average times from the rollups, one row per group
+
+    Args:
+        start: The first day to include.  Defaults to LIBTEKTICKET_METRICS_DAYS (30) days before end
+        end: The last day to include.  Defaults to today
+        group_by: 'technician', 'location' or 'urgency'
+
+    Returns:
+        A list of dicts with the group's label and its counts.  The backlog
+        is the number of tickets unresolved now, whatever the range
+
+    """
+
+    default_start, default_end = get_default_range()
+    start = start or default_start
+    end = end or default_end
+    key, label = GROUP_FIELDS[group_by]
+    names = dict.fromkeys([key, label])
+
+    rows = {}
+
+    def get_row(values):
+        row = rows.get(values[key])
+        if row is None:
+            row = rows[values[key]] = {
+                'key': values[key],
+                'label': values[label],
+                'opened': 0,
+                'resolved': 0,
+                'average_resolution_hours': None,
+                'first_noted': 0,
+                'average_first_note_hours': None,
+                'backlog': 0,
+            }
+            if group_by == 'urgency':
+                row['label'] = dict(Ticket.URGENCY_CHOICES).get(values[key], values[key])
+        return row
+
+    daily = TicketDailyStats.objects.filter(day__gte=start, day__lte=end).values(*names).annotate(
+        opened_sum=Sum('opened'),
+        resolved_sum=Sum('resolved'),
+        resolution_seconds_sum=Sum('resolution_seconds'),
+        first_noted_sum=Sum('first_noted'),
+        first_note_seconds_sum=Sum('first_note_seconds'),
+    ).order_by()
+    for values in daily:
+        row = get_row(values)
+        row['opened'] = values['opened_sum']
+        row['resolved'] = values['resolved_sum']
+        row['average_resolution_hours'] = get_hours(values['resolution_seconds_sum'], values['resolved_sum'])
+        row['first_noted'] = values['first_noted_sum']
+        row['average_first_note_hours'] = get_hours(values['first_note_seconds_sum'], values['first_noted_sum'])
+
+    for values in TicketBacklog.objects.values(*names).annotate(open_sum=Sum('open_count')).order_by():
+        if values['open_sum']:
+            get_row(values)['backlog'] = values['open_sum']
+
+    return sorted(rows.values(), key=lambda row: (row['label'] is None, str(row['label'])))
@@ -0,0 +1,38 @@
+# Generated by Django 4.1.2 on 2026-10-18 09:00
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libtekticket', '0023_rename_text_ticketnote_maintext'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboundMail',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('subject', models.CharField(help_text='The subject of the email', max_length=255, verbose_name='subject')),
+                ('message', models.TextField(help_text='The plain text body of the email', verbose_name='message')),
+                ('html_message', models.TextField(blank=True, help_text='The HTML body of the email', verbose_name='HTML message')),
+                ('from_email', models.CharField(help_text='The address from which the email is sent', max_length=254, verbose_name='from')),
+                ('recipients', models.TextField(help_text='The comma-separated list of emails to which the email is sent', verbose_name='recipients')),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('sending', 'Sending'), ('sent', 'Sent'), ('dead', 'Dead')], default='queued', help_text='If the email is waiting to be sent, is being sent, was sent, or was given up on after too many failures', max_length=10, verbose_name='status')),
+                ('attempts', models.PositiveIntegerField(default=0, help_text='The number of failed attempts to send the email', verbose_name='attempts')),
+                ('next_attempt', models.DateTimeField(default=django.utils.timezone.now, help_text='The earliest time at which the email should be sent', verbose_name='next attempt')),
+                ('last_error', models.TextField(blank=True, help_text='The error from the most recent failed attempt', verbose_name='last error')),
+                ('when', models.DateTimeField(auto_now_add=True, help_text='The date and time the email was queued', verbose_name='when')),
+                ('sent_when', models.DateTimeField(blank=True, help_text='The date and time the email was sent', null=True, verbose_name='sent')),
+            ],
+            options={
+                'ordering': ('next_attempt', 'pk'),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='outboundmail',
+            index=models.Index(fields=['status', 'next_attempt'], name='outboundmail_due_idx'),
+        ),
+    ]
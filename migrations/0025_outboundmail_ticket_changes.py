@@ -0,0 +1,24 @@
+# Generated by Django 4.1.2 on 2026-10-18 09:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libtekticket', '0024_outboundmail'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboundmail',
+            name='changes',
+            field=models.TextField(blank=True, help_text='The changes described by this email, one per line', verbose_name='changes'),
+        ),
+        migrations.AddField(
+            model_name='outboundmail',
+            name='ticket',
+            field=models.ForeignKey(blank=True, help_text='The ticket this email is about', null=True, on_delete=django.db.models.deletion.SET_NULL, to='libtekticket.ticket'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.1.2 on 2026-10-18 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libtekticket', '0025_outboundmail_ticket_changes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(fields=['is_resolved', '-when', 'urgency'], name='ticket_list_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ticketnote',
+            index=models.Index(fields=['ticket', 'when'], name='ticketnote_ticket_when_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='history',
+            index=models.Index(fields=['modelname', 'objectid', 'when'], name='history_object_when_idx'),
+        ),
+    ]
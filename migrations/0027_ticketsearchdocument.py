@@ -0,0 +1,87 @@
+# Generated by Django 4.1.2 on 2026-10-18 11:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        schema_editor.execute(
+            "CREATE INDEX libtekticket_ticket_fts ON libtekticket_ticketsearchdocument "
+            "USING GIN (to_tsvector('english', document))"
+        )
+    elif connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA compile_options")
+            if 'ENABLE_FTS5' not in [row[0] for row in cursor.fetchall()]:
+                # searches fall back to matching with LIKE
+                return
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE libtekticket_ticket_fts USING fts5("
+            "document, content='libtekticket_ticketsearchdocument', content_rowid='ticket_id')"
+        )
+        schema_editor.execute(
+            "CREATE TRIGGER libtekticket_ticket_fts_insert AFTER INSERT ON libtekticket_ticketsearchdocument BEGIN "
+            "INSERT INTO libtekticket_ticket_fts(rowid, document) VALUES (new.ticket_id, new.document); "
+            "END"
+        )
+        schema_editor.execute(
+            "CREATE TRIGGER libtekticket_ticket_fts_delete AFTER DELETE ON libtekticket_ticketsearchdocument BEGIN "
+            "INSERT INTO libtekticket_ticket_fts(libtekticket_ticket_fts, rowid, document) VALUES ('delete', old.ticket_id, old.document); "
+            "END"
+        )
+        schema_editor.execute(
+            "CREATE TRIGGER libtekticket_ticket_fts_update AFTER UPDATE ON libtekticket_ticketsearchdocument BEGIN "
+            "INSERT INTO libtekticket_ticket_fts(libtekticket_ticket_fts, rowid, document) VALUES ('delete', old.ticket_id, old.document); "
+            "INSERT INTO libtekticket_ticket_fts(rowid, document) VALUES (new.ticket_id, new.document); "
+            "END"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        schema_editor.execute("DROP INDEX IF EXISTS libtekticket_ticket_fts")
+    elif connection.vendor == 'sqlite':
+        for trigger in ['insert', 'delete', 'update']:
+            schema_editor.execute(f"DROP TRIGGER IF EXISTS libtekticket_ticket_fts_{trigger}")
+        schema_editor.execute("DROP TABLE IF EXISTS libtekticket_ticket_fts")
+
+
+def make_documents(apps, schema_editor):
+    Ticket = apps.get_model('libtekticket', 'Ticket')
+    TicketSearchDocument = apps.get_model('libtekticket', 'TicketSearchDocument')
+
+    documents = []
+    for ticket in Ticket.objects.prefetch_related('ticketnote_set').iterator(chunk_size=2000):
+        documents.append(TicketSearchDocument(
+            ticket_id=ticket.pk,
+            document='\n'.join(
+                [ticket.short_description, ticket.long_description, ticket.resolution_notes]
+                + [note.maintext for note in ticket.ticketnote_set.all()]
+            ),
+        ))
+        if len(documents) >= 2000:
+            TicketSearchDocument.objects.bulk_create(documents)
+            documents = []
+    TicketSearchDocument.objects.bulk_create(documents)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libtekticket', '0026_ticket_list_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TicketSearchDocument',
+            fields=[
+                ('ticket', models.OneToOneField(help_text='The ticket this text belongs to', on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_document', serialize=False, to='libtekticket.ticket')),
+                ('document', models.TextField(blank=True, help_text='The searchable text of the ticket, its resolution notes and its notes', verbose_name='document')),
+            ],
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+        migrations.RunPython(make_documents, migrations.RunPython.noop),
+    ]
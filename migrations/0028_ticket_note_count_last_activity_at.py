@@ -0,0 +1,36 @@
+# Generated by Django 4.1.2 on 2026-10-18 11:30
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def fill_summaries(apps, schema_editor):
+    Ticket = apps.get_model('libtekticket', 'Ticket')
+    TicketNote = apps.get_model('libtekticket', 'TicketNote')
+
+    notes = TicketNote.objects.filter(ticket=models.OuterRef('pk')).order_by().values('ticket')
+    Ticket.objects.update(
+        note_count=Coalesce(models.Subquery(notes.annotate(count=models.Count('pk')).values('count')), 0),
+        last_activity_at=Coalesce(models.Subquery(notes.annotate(latest=models.Max('when')).values('latest')), models.F('when')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libtekticket', '0027_ticketsearchdocument'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ticket',
+            name='last_activity_at',
+            field=models.DateTimeField(blank=True, db_index=True, editable=False, help_text='The date and time of the latest note, or when the ticket was submitted if it has no notes', null=True, verbose_name='last activity'),
+        ),
+        migrations.AddField(
+            model_name='ticket',
+            name='note_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='The number of notes on this ticket', verbose_name='notes'),
+        ),
+        migrations.RunPython(fill_summaries, migrations.RunPython.noop),
+    ]
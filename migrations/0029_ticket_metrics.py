@@ -0,0 +1,125 @@
+# Generated by Django 4.1.2 on 2026-10-18 12:00
+
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+import django.db.models.deletion
+
+
+def fill_first_note_at(apps, schema_editor):
+    Ticket = apps.get_model('libtekticket', 'Ticket')
+    TicketNote = apps.get_model('libtekticket', 'TicketNote')
+
+    notes = TicketNote.objects.filter(ticket=models.OuterRef('pk')).order_by().values('ticket')
+    Ticket.objects.update(
+        first_note_at=models.Subquery(notes.annotate(first=models.Min('when')).values('first')),
+    )
+
+
+def get_day(value):
+    if settings.USE_TZ and timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    if not settings.USE_TZ and timezone.is_aware(value):
+        value = timezone.make_naive(value)
+    if timezone.is_aware(value):
+        value = timezone.localtime(value)
+    return value.date()
+
+
+def get_seconds(start, end):
+    start, end = (timezone.make_naive(value) if timezone.is_aware(value) else value for value in (start, end))
+    return max(int((end - start).total_seconds()), 0)
+
+
+def build_metrics(apps, schema_editor):
+    """Fill the rollups from every ticket, as metrics.rebuild does, so the saves after this add to real totals"""
+
+    Ticket = apps.get_model('libtekticket', 'Ticket')
+    TicketDailyStats = apps.get_model('libtekticket', 'TicketDailyStats')
+    TicketBacklog = apps.get_model('libtekticket', 'TicketBacklog')
+
+    daily = defaultdict(lambda: defaultdict(int))
+    backlog = defaultdict(int)
+    fields = ['technician_id', 'location_id', 'urgency', 'is_resolved', 'when', 'resolved_at', 'first_note_at']
+    for values in Ticket.objects.order_by().values(*fields).iterator(chunk_size=2000):
+        bucket = (values['technician_id'], values['location_id'], values['urgency'])
+        daily[(get_day(values['when']),) + bucket]['opened'] += 1
+        if values['resolved_at'] is not None:
+            row = daily[(get_day(values['resolved_at']),) + bucket]
+            row['resolved'] += 1
+            row['resolution_seconds'] += get_seconds(values['when'], values['resolved_at'])
+        if values['first_note_at'] is not None:
+            row = daily[(get_day(values['first_note_at']),) + bucket]
+            row['first_noted'] += 1
+            row['first_note_seconds'] += get_seconds(values['when'], values['first_note_at'])
+        if not values['is_resolved']:
+            backlog[bucket] += 1
+
+    TicketDailyStats.objects.all().delete()
+    TicketBacklog.objects.all().delete()
+    TicketDailyStats.objects.bulk_create([
+        TicketDailyStats(day=day, technician_id=technician_id, location_id=location_id, urgency=urgency, **amounts)
+        for (day, technician_id, location_id, urgency), amounts in daily.items()
+    ], batch_size=2000)
+    TicketBacklog.objects.bulk_create([
+        TicketBacklog(technician_id=technician_id, location_id=location_id, urgency=urgency, open_count=open_count)
+        for (technician_id, location_id, urgency), open_count in backlog.items()
+    ], batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libtekin', '0015_auto_20220201_1522'),
+        ('libtekticket', '0028_ticket_note_count_last_activity_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ticket',
+            name='first_note_at',
+            field=models.DateTimeField(blank=True, editable=False, help_text='The date and time of the first note on the ticket', null=True, verbose_name='first note'),
+        ),
+        migrations.AddField(
+            model_name='ticket',
+            name='resolved_at',
+            field=models.DateTimeField(blank=True, editable=False, help_text='The date and time the ticket was marked resolved', null=True, verbose_name='resolved'),
+        ),
+        migrations.CreateModel(
+            name='TicketDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(help_text='The day these counts are for', verbose_name='day')),
+                ('urgency', models.IntegerField(choices=[(1, '1) Safety Hazard or Work Stoppage'), (2, '2) Major Work Impediment'), (3, '3) Highly Important Issue'), (4, '4) Moderately Important Issue'), (5, '5) Minor Issue or Suggestion')], help_text='The urgency of the tickets', verbose_name='urgency')),
+                ('opened', models.IntegerField(default=0, help_text='The number of tickets submitted', verbose_name='opened')),
+                ('resolved', models.IntegerField(default=0, help_text='The number of tickets resolved', verbose_name='resolved')),
+                ('resolution_seconds', models.BigIntegerField(default=0, help_text='The total seconds from submission to resolution of the resolved tickets', verbose_name='resolution seconds')),
+                ('first_noted', models.IntegerField(default=0, help_text='The number of tickets which got their first note', verbose_name='first noted')),
+                ('first_note_seconds', models.BigIntegerField(default=0, help_text='The total seconds from submission to first note of the first noted tickets', verbose_name='first note seconds')),
+                ('location', models.ForeignKey(blank=True, help_text='The location of the tickets', null=True, on_delete=django.db.models.deletion.SET_NULL, to='libtekin.location')),
+                ('technician', models.ForeignKey(blank=True, help_text='The technician the tickets were assigned to', null=True, on_delete=django.db.models.deletion.SET_NULL, to='libtekticket.technician')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TicketBacklog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('urgency', models.IntegerField(choices=[(1, '1) Safety Hazard or Work Stoppage'), (2, '2) Major Work Impediment'), (3, '3) Highly Important Issue'), (4, '4) Moderately Important Issue'), (5, '5) Minor Issue or Suggestion')], help_text='The urgency of the tickets', verbose_name='urgency')),
+                ('open_count', models.IntegerField(default=0, help_text='The number of unresolved tickets', verbose_name='open')),
+                ('location', models.ForeignKey(blank=True, help_text='The location of the tickets', null=True, on_delete=django.db.models.deletion.SET_NULL, to='libtekin.location')),
+                ('technician', models.ForeignKey(blank=True, help_text='The technician the tickets are assigned to', null=True, on_delete=django.db.models.deletion.SET_NULL, to='libtekticket.technician')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='ticketdailystats',
+            index=models.Index(fields=['day', 'technician', 'location', 'urgency'], name='ticketdailystats_bucket_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ticketbacklog',
+            index=models.Index(fields=['technician', 'location', 'urgency'], name='ticketbacklog_bucket_idx'),
+        ),
+        migrations.RunPython(fill_first_note_at, migrations.RunPython.noop),
+        migrations.RunPython(build_metrics, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 4.1.2 on 2026-10-18 13:00
+
+import re
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import Lower
+import django.db.models.deletion
+
+
+def fill_subscribers(apps, schema_editor):
+    Ticket = apps.get_model('libtekticket', 'Ticket')
+    TicketSubscriber = apps.get_model('libtekticket', 'TicketSubscriber')
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+
+    users = {}
+    for user_id, email in User.objects.annotate(lower_email=Lower('email')).exclude(lower_email='').order_by('-pk').values_list('pk', 'lower_email'):
+        users[email] = user_id
+
+    subscribers = []
+    for ticket_id, recipient_emails in Ticket.objects.exclude(recipient_emails='').values_list('pk', 'recipient_emails').iterator(chunk_size=2000):
+        emails = dict.fromkeys(email.lower() for email in re.split(r'[,;\s]+', recipient_emails) if '@' in email)
+        for email in emails:
+            subscribers.append(TicketSubscriber(ticket_id=ticket_id, email=email, user_id=users.get(email)))
+        if len(subscribers) >= 2000:
+            TicketSubscriber.objects.bulk_create(subscribers)
+            subscribers = []
+    TicketSubscriber.objects.bulk_create(subscribers)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('libtekticket', '0029_ticket_metrics'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TicketSubscriber',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('email', models.EmailField(db_index=True, help_text='The lowercased email address which gets updates on the ticket', max_length=254, verbose_name='email')),
+                ('ticket', models.ForeignKey(help_text='The ticket about which updates are sent', on_delete=django.db.models.deletion.CASCADE, related_name='subscribers', to='libtekticket.ticket')),
+                ('user', models.ForeignKey(blank=True, help_text='The user with this email, if there was one when the subscription was added', null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='user')),
+            ],
+            options={
+                'ordering': ['pk'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='ticketsubscriber',
+            constraint=models.UniqueConstraint(fields=('ticket', 'email'), name='ticketsubscriber_ticket_email_unique'),
+        ),
+        migrations.RunPython(fill_subscribers, migrations.RunPython.noop),
+    ]
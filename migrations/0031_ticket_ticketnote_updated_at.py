@@ -0,0 +1,40 @@
+# Generated by Django 4.1.2 on 2026-10-18 14:00
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+import django.utils.timezone
+
+
+def fill_updated_at(apps, schema_editor):
+    Ticket = apps.get_model('libtekticket', 'Ticket')
+    TicketNote = apps.get_model('libtekticket', 'TicketNote')
+
+    Ticket.objects.update(updated_at=Coalesce(models.F('last_activity_at'), models.F('when')))
+    TicketNote.objects.update(updated_at=models.F('when'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libtekticket', '0030_ticketsubscriber'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ticket',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, help_text='The date and time the ticket or one of its notes was last changed', verbose_name='updated'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='ticketnote',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, help_text='The date and time the note was last changed', verbose_name='updated'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_updated_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(fields=['updated_at', 'id'], name='ticket_updated_idx'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.1.2 on 2026-10-18 17:07
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('libtekticket', '0031_ticket_ticketnote_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='APIToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(blank=True, help_text='What uses the token, such as a kiosk or a monitoring system', max_length=100, verbose_name='name')),
+                ('key_hash', models.CharField(editable=False, help_text='The SHA-256 hash of the key sent in the Authorization header', max_length=64, unique=True, verbose_name='key hash')),
+                ('created', models.DateTimeField(auto_now_add=True, help_text='The date and time the token was created', verbose_name='created')),
+            ],
+            options={
+                'verbose_name': 'API token',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(fields=['when', 'id'], name='ticket_when_idx'),
+        ),
+        migrations.AddField(
+            model_name='apitoken',
+            name='user',
+            field=models.ForeignKey(help_text='The user whose permissions the token has', on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='user'),
+        ),
+    ]
@@ -1,10 +1,104 @@
+import hashlib
+import re
+import secrets
+import time
+from collections import defaultdict
+from django.core.exceptions import ObjectDoesNotExist
 from django.db import models
+from django.db.models.functions import Coalesce, Lower
+from django.db.models.query import ModelIterable
 from django.conf import settings
 from datetime import datetime
 from django.apps import apps
+from django.core.cache import cache
+from django.utils import timezone
 from libtekin.models import Item, Location
 from django.contrib.auth import get_user_model
 
+def parse_emails(text):
+    """The distinct addresses in a comma-separated list of emails, lowercased, in order"""
+
+    return list(dict.fromkeys(email.lower() for email in re.split(r'[,;\s]+', text) if '@' in email))
+
+
+VISTA_GENERATION_CACHE_KEY = 'libtekticket_vista_generation'
+
+
+def get_vista_cache_key(user, name):
+    """A cache key for vista data of a user, which changes whenever any vista is saved or deleted
+
+    Global vistas can apply to every user, so any vista change replaces every user's cached vistas
+    """
+
+    generation = cache.get_or_set(VISTA_GENERATION_CACHE_KEY, time.time_ns, None)
+    return f'libtekticket_vista_{name}_{user.pk}_{generation}'
+
+
+def clear_vista_cache():
+    cache.set(VISTA_GENERATION_CACHE_KEY, time.time_ns(), None)
+
+
+RELATED_LABELS_VERSION_CACHE_KEY = 'libtekticket_related_labels_version'
+
+
+def get_related_labels_version():
+    """A value that changes whenever a technician, item, location or user is saved or deleted
+
+    The API shows these objects' names with tickets and notes, so responses
+    which include them change with it
+    """
+
+    return cache.get_or_set(RELATED_LABELS_VERSION_CACHE_KEY, time.time_ns, None)
+
+
+def bump_related_labels_version():
+    cache.set(RELATED_LABELS_VERSION_CACHE_KEY, time.time_ns(), None)
+
+
+class TechnicianQuerySet(models.QuerySet):
+
+    def for_user(self, user):
+        if user is None or user.pk is None:
+            return self.none()
+        return self.filter(user_id=user.pk)
+
+
+class TechnicianManager(models.Manager.from_queryset(TechnicianQuerySet)):
+
+    user_ids_cache_key = 'libtekticket_technician_user_ids'
+    recipient_emails_cache_key = 'libtekticket_default_recipient_emails'
+
+    def get_cache_timeout(self):
+        # the caches are cleared when technicians change, so the timeout only limits how long a missed clear lasts
+        return getattr(settings, 'LIBTEKTICKET_TECHNICIAN_CACHE_TIMEOUT', 300)
+
+    def get_user_ids(self):
+        """The ids of all users who are technicians, cached until a technician is saved or deleted"""
+
+        user_ids = cache.get(self.user_ids_cache_key)
+        if user_ids is None:
+            user_ids = frozenset(self.filter(user__isnull=False).values_list('user_id', flat=True))
+            cache.set(self.user_ids_cache_key, user_ids, self.get_cache_timeout())
+        return user_ids
+
+    def is_tech(self, user):
+        return user is not None and user.pk is not None and user.pk in self.get_user_ids()
+
+    def default_recipient_emails(self):
+        """The emails of current technicians' users, who get ticket mail by default, cached until a technician or one of their users changes"""
+
+        emails = cache.get(self.recipient_emails_cache_key)
+        if emails is None:
+            emails = tuple(dict.fromkeys(
+                self.filter(is_current=True, user__isnull=False).exclude(user__email='').order_by('pk').values_list('user__email', flat=True)
+            ))
+            cache.set(self.recipient_emails_cache_key, emails, self.get_cache_timeout())
+        return emails
+
+    def clear_cache(self):
+        cache.delete_many([self.user_ids_cache_key, self.recipient_emails_cache_key])
+
+
 class Technician(models.Model):
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -26,12 +120,43 @@ class Technician(models.Model):
         help_text='If this technician is current (should receive emails from tickets, etc)'
     )
 
+    objects = TechnicianManager()
+
     def __str__(self):
         return f"{self.name}"
 
     @classmethod
     def user_is_tech(cls, user):
-        return user in [ technician.user for technician in Technician.objects.all() ]
+        return cls.objects.is_tech(user)
+
+class TicketQuerySet(models.QuerySet):
+
+    def refresh_summaries(self):
+        """Recalculate note_count and last_activity_at for these tickets from their notes"""
+
+        notes = TicketNote.objects.filter(ticket=models.OuterRef('pk')).order_by().values('ticket')
+        return self.update(
+            note_count=Coalesce(models.Subquery(notes.annotate(count=models.Count('pk')).values('count')), 0),
+            last_activity_at=Coalesce(models.Subquery(notes.annotate(latest=models.Max('when')).values('latest')), models.F('when')),
+        )
+
+    def touch(self):
+        """Mark these tickets changed now, for changes made without saving them"""
+
+        return self.update(updated_at=timezone.now())
+
+    def add_note_activity(self, when):
+        """Count a new note on these tickets without recalculating from all notes"""
+
+        return self.update(
+            updated_at=timezone.now(),
+            note_count=models.F('note_count') + 1,
+            last_activity_at=models.Case(
+                models.When(models.Q(last_activity_at__isnull=True) | models.Q(last_activity_at__lt=when), then=models.Value(when)),
+                default=models.F('last_activity_at'),
+            ),
+        )
+
 
 class Ticket(models.Model):
     URGENCY_CHOICES = (
@@ -107,15 +232,128 @@ class Ticket(models.Model):
         blank=True,
         help_text='The comma-separated list of emails of those who should get updates on this ticket.  By default, emails are sent for changes in notes and resolution status'
     )
+    note_count = models.PositiveIntegerField(
+        'notes',
+        default=0,
+        editable=False,
+        help_text='The number of notes on this ticket'
+    )
+    last_activity_at = models.DateTimeField(
+        'last activity',
+        null=True,
+        blank=True,
+        editable=False,
+        db_index=True,
+        help_text='The date and time of the latest note, or when the ticket was submitted if it has no notes'
+    )
+    resolved_at = models.DateTimeField(
+        'resolved',
+        null=True,
+        blank=True,
+        editable=False,
+        help_text='The date and time the ticket was marked resolved'
+    )
+    first_note_at = models.DateTimeField(
+        'first note',
+        null=True,
+        blank=True,
+        editable=False,
+        help_text='The date and time of the first note on the ticket'
+    )
+    updated_at = models.DateTimeField(
+        'updated',
+        auto_now=True,
+        help_text='The date and time the ticket or one of its notes was last changed'
+    )
+
+    objects = TicketQuerySet.as_manager()
 
     def __str__(self):
         return self.short_description
 
+    def save(self, *args, **kwargs):
+        if self.last_activity_at is None:
+            self.last_activity_at = self.when
+        super().save(*args, **kwargs)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'recipient_emails' in update_fields:
+            self.sync_subscribers()
+
+    @classmethod
+    def get_form_update_fields(cls, form):
+        """The fields to save for a ticket changed by a form: the form's fields and those set by the save signals
+
+        note_count and last_activity_at are left out, since the note signals keep them
+        with update() and the form's copy of the ticket may be older
+        """
+
+        names = {field.name for field in cls._meta.concrete_fields}
+        return [name for name in form.fields if name in names] + ['updated_at', 'resolved_at']
+
+    def sync_subscribers(self):
+        """Make this ticket's subscribers match its recipient_emails, linking each to the user with that email"""
+
+        emails = parse_emails(self.recipient_emails)
+        existing = set(self.subscribers.values_list('email', flat=True))
+
+        removed = existing.difference(emails)
+        if removed:
+            self.subscribers.filter(email__in=removed).delete()
+
+        added = [email for email in emails if email not in existing]
+        if added:
+            users = {}
+            for user_id, email in get_user_model().objects.annotate(
+                lower_email=Lower('email')
+            ).filter(lower_email__in=added).order_by('-pk').values_list('pk', 'lower_email'):
+                users[email] = user_id
+            TicketSubscriber.objects.bulk_create(
+                [TicketSubscriber(ticket=self, email=email, user_id=users.get(email)) for email in added]
+            )
+
     def user_is_editor(self, user):
         return user == self.submitted_by or user.has_perm('libtekticket.change_ticket')
 
+    @staticmethod
+    def get_cache_version_key(pk):
+        return f'libtekticket_ticket_version_{pk}'
+
+    @staticmethod
+    def get_cache_version_timeout():
+        # a version which expires is replaced by a new one, which only means the pages cached under the
+        # old one are made again, so the versions are kept longer than the pages but not forever
+        return getattr(settings, 'LIBTEKTICKET_CACHE_VERSION_TIMEOUT', 86400)
+
+    def get_cache_version(self):
+        """A value that changes whenever this ticket or its notes change, for cache keys"""
+
+        return cache.get_or_set(self.get_cache_version_key(self.pk), time.time_ns, self.get_cache_version_timeout())
+
+    list_cache_version_key = 'libtekticket_ticket_list_version'
+
+    @classmethod
+    def get_list_cache_version(cls):
+        """A value that changes whenever any ticket or note changes, for cache keys of ticket lists"""
+
+        return cache.get_or_set(cls.list_cache_version_key, time.time_ns, cls.get_cache_version_timeout())
+
+    @classmethod
+    def bump_cache_versions(cls, pks):
+        version = time.time_ns()
+        versions = {cls.get_cache_version_key(pk): version for pk in pks}
+        versions[cls.list_cache_version_key] = version
+        cache.set_many(versions, cls.get_cache_version_timeout())
+
     class Meta:
         ordering=['is_resolved', '-when', 'urgency']
+        indexes = [
+            # matches the default list filter (is_resolved=False) and ordering
+            models.Index(fields=['is_resolved', '-when', 'urgency'], name='ticket_list_idx'),
+            # for the changes feed, which pages by (updated_at, id)
+            models.Index(fields=['updated_at', 'id'], name='ticket_updated_idx'),
+            # for the API's ticket list, which pages newest first by (when, id)
+            models.Index(fields=['when', 'id'], name='ticket_when_idx'),
+        ]
 
 
 class TicketNote(models.Model):
@@ -143,10 +381,89 @@ class TicketNote(models.Model):
         default=datetime.now,
         help_text='The date that the note was submitted'
     )
+    updated_at = models.DateTimeField(
+        'updated',
+        auto_now=True,
+        help_text='The date and time the note was last changed'
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['ticket', 'when'], name='ticketnote_ticket_when_idx'),
+        ]
 
     def __str__(self):
         return self.maintext
 
+
+class TicketSubscriberQuerySet(models.QuerySet):
+
+    def for_user(self, user):
+        """Subscriptions of a user, by their account or by their email"""
+
+        if user is None or user.pk is None:
+            return self.none()
+        condition = models.Q(user_id=user.pk)
+        if user.email:
+            condition = condition | models.Q(email=user.email.lower())
+        return self.filter(condition)
+
+
+class TicketSubscriber(models.Model):
+    ticket = models.ForeignKey(
+        Ticket,
+        on_delete=models.CASCADE,
+        related_name='subscribers',
+        help_text='The ticket about which updates are sent'
+    )
+    email = models.EmailField(
+        'email',
+        db_index=True,
+        help_text='The lowercased email address which gets updates on the ticket'
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        verbose_name='user',
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        help_text='The user with this email, if there was one when the subscription was added'
+    )
+
+    objects = TicketSubscriberQuerySet.as_manager()
+
+    class Meta:
+        ordering = ['pk']
+        constraints = [
+            models.UniqueConstraint(fields=['ticket', 'email'], name='ticketsubscriber_ticket_email_unique'),
+        ]
+
+    def __str__(self):
+        return f'{self.email}: {self.ticket}'
+
+class HistoryQuerySet(models.QuerySet):
+
+    _with_object_labels = False
+
+    def with_object_labels(self):
+        """Look up the changed objects for all fetched rows at once, with one query per model"""
+
+        clone = self._chain()
+        clone._with_object_labels = True
+        return clone
+
+    def _clone(self):
+        clone = super()._clone()
+        clone._with_object_labels = self._with_object_labels
+        return clone
+
+    def _fetch_all(self):
+        fetched = self._result_cache is not None
+        super()._fetch_all()
+        if self._with_object_labels and not fetched and self._iterable_class is ModelIterable:
+            History.attach_object_labels(self._result_cache)
+
+
 class History(models.Model):
 
     when = models.DateTimeField(
@@ -191,19 +508,313 @@ class History(models.Model):
 
     class Meta:
         ordering = ('-when', 'modelname', 'objectid')
+        indexes = [
+            models.Index(fields=['modelname', 'objectid', 'when'], name='history_object_when_idx'),
+        ]
+
+    objects = HistoryQuerySet.as_manager()
 
     def __str__(self):
 
         new_value_trunc = self.new_value[:17:]+'...' if len(self.new_value) > 20 else self.new_value
 
+        object_label = self.object_label if hasattr(self, 'object_label') else self.get_object_label()
+        if object_label is not None:
+            return f'{self.when.strftime("%Y-%m-%d")}: {self.modelname}: [{object_label}] [{self.fieldname}] changed to "{new_value_trunc}"'
+
+        return f'{self.when.strftime("%Y-%m-%d")}: {self.modelname}: {self.objectid} [{self.fieldname}] changed to "{new_value_trunc}"'
+
+    def get_object_label(self):
         try:
             model = apps.get_model('libtekticket', self.modelname)
-            object = model.objects.get(pk=self.objectid)
-            return f'{self.when.strftime("%Y-%m-%d")}: {self.modelname}: [{object}] [{self.fieldname}] changed to "{new_value_trunc}"'
+            return str(model.objects.get(pk=self.objectid))
+        except (LookupError, ObjectDoesNotExist):
+            return None
 
-        except Exception as e:
-            print (e)
+    @staticmethod
+    def attach_object_labels(histories):
+        """Set object_label on each history, fetching the changed objects with one query per model"""
 
-        return f'{"mdy".format(self.when.strftime("%Y-%m-%d"))}: {self.modelname}: {self.objectid} [{self.fieldname}] changed to "{new_value_trunc}"'
+        objectids = defaultdict(set)
+        for history in histories:
+            if history.objectid is not None:
+                objectids[history.modelname.lower()].add(history.objectid)
 
+        objects = {}
+        for modelname, ids in objectids.items():
+            try:
+                model = apps.get_model('libtekticket', modelname)
+            except LookupError:
+                continue
+            objects[modelname] = model._default_manager.in_bulk(ids)
 
+        for history in histories:
+            object = objects.get(history.modelname.lower(), {}).get(history.objectid)
+            history.object_label = None if object is None else str(object)
+
+
+
+
+class OutboundMail(models.Model):
+    STATUS_QUEUED = 'queued'
+    STATUS_SENDING = 'sending'
+    STATUS_SENT = 'sent'
+    STATUS_DEAD = 'dead'
+    STATUS_CHOICES = (
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_SENDING, 'Sending'),
+        (STATUS_SENT, 'Sent'),
+        (STATUS_DEAD, 'Dead'),
+    )
+
+    subject = models.CharField(
+        'subject',
+        max_length=255,
+        help_text='The subject of the email'
+    )
+    message = models.TextField(
+        'message',
+        help_text='The plain text body of the email'
+    )
+    html_message = models.TextField(
+        'HTML message',
+        blank=True,
+        help_text='The HTML body of the email'
+    )
+    from_email = models.CharField(
+        'from',
+        max_length=254,
+        help_text='The address from which the email is sent'
+    )
+    recipients = models.TextField(
+        'recipients',
+        help_text='The comma-separated list of emails to which the email is sent'
+    )
+    status = models.CharField(
+        'status',
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default=STATUS_QUEUED,
+        help_text='If the email is waiting to be sent, is being sent, was sent, or was given up on after too many failures'
+    )
+    attempts = models.PositiveIntegerField(
+        'attempts',
+        default=0,
+        help_text='The number of failed attempts to send the email'
+    )
+    next_attempt = models.DateTimeField(
+        'next attempt',
+        default=timezone.now,
+        help_text='The earliest time at which the email should be sent'
+    )
+    last_error = models.TextField(
+        'last error',
+        blank=True,
+        help_text='The error from the most recent failed attempt'
+    )
+    when = models.DateTimeField(
+        'when',
+        auto_now_add=True,
+        help_text='The date and time the email was queued'
+    )
+    sent_when = models.DateTimeField(
+        'sent',
+        null=True,
+        blank=True,
+        help_text='The date and time the email was sent'
+    )
+    ticket = models.ForeignKey(
+        Ticket,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        help_text='The ticket this email is about'
+    )
+    changes = models.TextField(
+        'changes',
+        blank=True,
+        help_text='The changes described by this email, one per line'
+    )
+
+    class Meta:
+        ordering = ('next_attempt', 'pk')
+        indexes = [
+            models.Index(fields=['status', 'next_attempt'], name='outboundmail_due_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.subject} ({self.get_status_display()})'
+
+    def get_recipient_list(self):
+        return [email.strip() for email in self.recipients.split(',') if email.strip()]
+
+    def get_change_list(self):
+        return [change for change in self.changes.split('\n') if change]
+
+
+class TicketSearchDocument(models.Model):
+    ticket = models.OneToOneField(
+        Ticket,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='search_document',
+        help_text='The ticket this text belongs to'
+    )
+    document = models.TextField(
+        'document',
+        blank=True,
+        help_text='The searchable text of the ticket, its resolution notes and its notes'
+    )
+
+    def __str__(self):
+        return f'{self.ticket}'
+
+
+class TicketDailyStats(models.Model):
+    day = models.DateField(
+        'day',
+        help_text='The day these counts are for'
+    )
+    technician = models.ForeignKey(
+        Technician,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        help_text='The technician the tickets were assigned to'
+    )
+    location = models.ForeignKey(
+        Location,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        help_text='The location of the tickets'
+    )
+    urgency = models.IntegerField(
+        'urgency',
+        choices=Ticket.URGENCY_CHOICES,
+        help_text='The urgency of the tickets'
+    )
+    opened = models.IntegerField(
+        'opened',
+        default=0,
+        help_text='The number of tickets submitted'
+    )
+    resolved = models.IntegerField(
+        'resolved',
+        default=0,
+        help_text='The number of tickets resolved'
+    )
+    resolution_seconds = models.BigIntegerField(
+        'resolution seconds',
+        default=0,
+        help_text='The total seconds from submission to resolution of the resolved tickets'
+    )
+    first_noted = models.IntegerField(
+        'first noted',
+        default=0,
+        help_text='The number of tickets which got their first note'
+    )
+    first_note_seconds = models.BigIntegerField(
+        'first note seconds',
+        default=0,
+        help_text='The total seconds from submission to first note of the first noted tickets'
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['day', 'technician', 'location', 'urgency'], name='ticketdailystats_bucket_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.day}: {self.technician} {self.location} {self.urgency}'
+
+
+class TicketBacklog(models.Model):
+    technician = models.ForeignKey(
+        Technician,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        help_text='The technician the tickets are assigned to'
+    )
+    location = models.ForeignKey(
+        Location,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        help_text='The location of the tickets'
+    )
+    urgency = models.IntegerField(
+        'urgency',
+        choices=Ticket.URGENCY_CHOICES,
+        help_text='The urgency of the tickets'
+    )
+    open_count = models.IntegerField(
+        'open',
+        default=0,
+        help_text='The number of unresolved tickets'
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['technician', 'location', 'urgency'], name='ticketbacklog_bucket_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.technician} {self.location} {self.urgency}: {self.open_count}'
+
+
+class APITokenManager(models.Manager):
+
+    @staticmethod
+    def hash_key(key):
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    def create_token(self, user, name=''):
+        """A new token for a user, with its key, which is only stored as a hash so it can't be shown again"""
+
+        key = secrets.token_urlsafe(32)
+        return self.create(user=user, name=name, key_hash=self.hash_key(key)), key
+
+    def get_user(self, key):
+        """The active user whose token has this key, or None"""
+
+        token = self.select_related('user').filter(key_hash=self.hash_key(key)).first()
+        if token is None or not token.user.is_active:
+            return None
+        return token.user
+
+
+class APIToken(models.Model):
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        verbose_name='user',
+        on_delete=models.CASCADE,
+        help_text='The user whose permissions the token has'
+    )
+    name = models.CharField(
+        'name',
+        max_length=100,
+        blank=True,
+        help_text='What uses the token, such as a kiosk or a monitoring system'
+    )
+    key_hash = models.CharField(
+        'key hash',
+        max_length=64,
+        unique=True,
+        editable=False,
+        help_text='The SHA-256 hash of the key sent in the Authorization header'
+    )
+    created = models.DateTimeField(
+        'created',
+        auto_now_add=True,
+        help_text='The date and time the token was created'
+    )
+
+    objects = APITokenManager()
+
+    class Meta:
+        verbose_name = 'API token'
+
+    def __str__(self):
+        return f'{self.name}: {self.user}'
@@ -0,0 +1,208 @@
+import base64
+import binascii
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet, ValidationError
+from django.core.paginator import InvalidPage, Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+
+class KeysetPage:
+    """A page of a KeysetPaginator, with cursors to the pages either side of it"""
+
+    is_keyset = True
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        return f'<Keyset page of {len(self.object_list)}>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def next_cursor(self):
+        if self._has_next and self.object_list:
+            return self.paginator.encode_cursor(self.object_list[-1])
+        return ''
+
+    @property
+    def previous_cursor(self):
+        if self._has_previous and self.object_list:
+            return self.paginator.encode_cursor(self.object_list[0])
+        return ''
+
+
+class KeysetPaginator:
+    """Pages through a queryset by the values of its ordering keys instead of by offset
+
+    Each page is fetched with a range condition on the ordering, so deep
+    pages cost the same as the first one and no count is needed.  The
+    ordering must be unique (end it with 'pk') and its fields must not be
+    null.
+
+    Args:
+        queryset: The queryset to page through
+        per_page: The number of objects on a page
+        ordering: A list of field names, each optionally prefixed with '-' for descending
+
+    """
+
+    def __init__(self, queryset, per_page, ordering):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        self.ordering = list(ordering)
+        self.fields = [self.get_field(name.lstrip('-')) for name in self.ordering]
+
+    def get_field(self, name):
+        if name == 'pk':
+            return self.queryset.model._meta.pk
+        return self.queryset.model._meta.get_field(name)
+
+    def encode_cursor(self, obj):
+        values = [field.value_to_string(obj) for field in self.fields]
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def decode_cursor(self, cursor):
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            if len(values) != len(self.fields):
+                raise ValueError
+            return [field.to_python(value) for field, value in zip(self.fields, values)]
+        except (binascii.Error, ValueError, TypeError, ValidationError):
+            raise InvalidPage('That page cursor is not valid')
+
+    def get_range(self, values, forward=True):
+        """A condition for the objects after (or before) the object with these key values"""
+
+        condition = Q()
+        for index, name in enumerate(self.ordering):
+            descending = name.startswith('-')
+            lookup = 'gt' if descending != forward else 'lt'
+            term = Q(**{f"{name.lstrip('-')}__{lookup}": values[index]})
+            for previous_name, previous_value in zip(self.ordering[:index], values[:index]):
+                term = term & Q(**{previous_name.lstrip('-'): previous_value})
+            condition = condition | term
+        return condition
+
+    def reverse_ordering(self):
+        return [name[1:] if name.startswith('-') else f'-{name}' for name in self.ordering]
+
+    def page(self, after=None, before=None, last=False):
+        """Get the page after the cursor after, before the cursor before, the last page, or the first page"""
+
+        if after:
+            rows = list(self.queryset.filter(self.get_range(self.decode_cursor(after))).order_by(*self.ordering)[:self.per_page + 1])
+            return KeysetPage(rows[:self.per_page], self, len(rows) > self.per_page, True)
+
+        if before or last:
+            queryset = self.queryset
+            if before:
+                queryset = queryset.filter(self.get_range(self.decode_cursor(before), forward=False))
+            rows = list(queryset.order_by(*self.reverse_ordering())[:self.per_page + 1])
+            object_list = rows[:self.per_page]
+            object_list.reverse()
+            return KeysetPage(object_list, self, bool(before), len(rows) > self.per_page)
+
+        rows = list(self.queryset.order_by(*self.ordering)[:self.per_page + 1])
+        return KeysetPage(rows[:self.per_page], self, len(rows) > self.per_page, False)
+
+
+class CachedPKPaginator(Paginator):
+    """A Paginator which caches the ordered primary keys of its queryset
+
+    The count comes from the length of the cached list, and each page is
+    fetched by primary key, so repeat views of a list make no count query
+    and no deep offset scan.  Lists longer than max_ids are paged as usual,
+    with only their count cached.
+
+    Args:
+        object_list: The queryset to page through
+        per_page: The number of objects on a page
+        cache_key: The cache key for the list.  Include a version which
+            changes when the objects change.  If None, the key is made from
+            the queryset's SQL
+        timeout: Seconds the list is cached for
+        max_ids: The longest list which is cached
+
+    """
+
+    def __init__(self, object_list, per_page, orphans=0, allow_empty_first_page=True, cache_key=None, timeout=30, max_ids=10000):
+        super().__init__(object_list, per_page, orphans, allow_empty_first_page)
+        self.cache_key = cache_key
+        self.timeout = timeout
+        self.max_ids = max_ids
+
+    @staticmethod
+    def get_query_signature(queryset):
+        """A hash of the queryset's SQL and parameters, or None if it can't be made"""
+
+        try:
+            sql, params = queryset.query.sql_with_params()
+        except EmptyResultSet:
+            return None
+        return hashlib.md5(f'{sql}|{params!r}'.encode()).hexdigest()
+
+    @cached_property
+    def cached(self):
+        """The ordered primary keys of the whole list, or its count if it is longer than max_ids
+
+        Caching the count of a long list saves fetching max_ids keys again on every view
+        """
+
+        if self.cache_key is None:
+            return None
+        cached = cache.get(self.cache_key)
+        if cached is None:
+            cached = list(self.object_list.values_list('pk', flat=True)[:self.max_ids + 1])
+            if len(cached) > self.max_ids:
+                cached = super().count
+            cache.set(self.cache_key, cached, self.timeout)
+        return cached
+
+    @property
+    def pks(self):
+        """The ordered primary keys of the whole list, or None if it is too long to cache"""
+
+        return self.cached if isinstance(self.cached, list) else None
+
+    @cached_property
+    def count(self):
+        if isinstance(self.cached, int):
+            return self.cached
+        if self.pks is None:
+            return super().count
+        return len(self.pks)
+
+    def page(self, number):
+        if self.pks is None:
+            return super().page(number)
+
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        top = bottom + self.per_page
+        if top + self.orphans >= self.count:
+            top = self.count
+        page_pks = self.pks[bottom:top]
+        objects = self.object_list.order_by().in_bulk(page_pks)
+        # objects deleted since the list was cached are left out
+        return self._get_page([objects[pk] for pk in page_pks if pk in objects], number, self)
@@ -0,0 +1,162 @@
+import re
+
+from django.conf import settings
+from django.core.exceptions import EmptyResultSet
+from django.db import connection, transaction
+from django.db.models import Case, IntegerField, Q, Value, When
+
+from .models import Ticket, TicketSearchDocument
+
+# created by migration 0027: an FTS5 table on SQLite or a GIN index on PostgreSQL
+FTS_NAME = 'libtekticket_ticket_fts'
+POSTGRES_CONFIG = 'english'
+
+
+def get_document(ticket):
+    """The searchable text of a ticket: its descriptions, resolution notes and notes"""
+
+    return '\n'.join(
+        [ticket.short_description, ticket.long_description, ticket.resolution_notes]
+        + list(ticket.ticketnote_set.values_list('maintext', flat=True))
+    )
+
+
+def update_ticket_index(ticket_id):
+    ticket = Ticket.objects.filter(pk=ticket_id).first()
+    if ticket is None:
+        return
+
+    TicketSearchDocument.objects.update_or_create(
+        ticket=ticket,
+        defaults={'document': get_document(ticket)},
+    )
+
+
+def queue_ticket_index(ticket_id):
+    """Update the search text of a ticket once the current transaction commits"""
+
+    transaction.on_commit(lambda: update_ticket_index(ticket_id))
+
+
+def rebuild_index(chunk_size=2000):
+    """Replace the search text of every ticket"""
+
+    with transaction.atomic():
+        TicketSearchDocument.objects.all().delete()
+
+        documents = []
+        for ticket in Ticket.objects.order_by().prefetch_related('ticketnote_set').iterator(chunk_size=chunk_size):
+            documents.append(TicketSearchDocument(
+                ticket=ticket,
+                document='\n'.join(
+                    [ticket.short_description, ticket.long_description, ticket.resolution_notes]
+                    + [note.maintext for note in ticket.ticketnote_set.all()]
+                ),
+            ))
+            if len(documents) >= chunk_size:
+                TicketSearchDocument.objects.bulk_create(documents)
+                documents = []
+        TicketSearchDocument.objects.bulk_create(documents)
+
+
+# the backend of each database, found on its first search
+backends = {}
+
+
+def get_backend():
+    """'postgresql', 'sqlite' if the FTS5 table exists, or None to search with LIKE"""
+
+    key = (connection.alias, connection.settings_dict['NAME'])
+    if key not in backends:
+        if connection.vendor == 'postgresql':
+            backends[key] = 'postgresql'
+        elif connection.vendor == 'sqlite' and FTS_NAME in connection.introspection.table_names():
+            backends[key] = 'sqlite'
+        else:
+            backends[key] = None
+    return backends[key]
+
+
+def search_ticket_ids(search, limit, queryset=None):
+    """The ids of the tickets matching every word of search, best match first
+
+    Args:
+        search: The text to search for
+        limit: The most ids to return
+        queryset: If given, only tickets in this queryset are matched, so the
+            limit counts only them
+
+    """
+
+    terms = re.findall(r'\w+', search)
+    if not terms:
+        return []
+
+    backend = get_backend()
+
+    restriction, restriction_params = '', []
+    if queryset is not None and backend is not None:
+        try:
+            sql, restriction_params = queryset.order_by().values('pk').query.sql_with_params()
+        except EmptyResultSet:
+            return []
+        column = 'rowid' if backend == 'sqlite' else 'ticket_id'
+        restriction = f'AND {column} IN ({sql}) '
+        restriction_params = list(restriction_params)
+
+    if backend == 'sqlite':
+        # each word is quoted so it is not read as an FTS5 operator, and matches as a prefix
+        match = ' '.join(f'"{term}"*' for term in terms)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM {FTS_NAME} WHERE {FTS_NAME} MATCH %s {restriction}ORDER BY rank LIMIT %s',
+                [match] + restriction_params + [limit]
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    if backend == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT ticket_id FROM {TicketSearchDocument._meta.db_table} '
+                f"WHERE to_tsvector('{POSTGRES_CONFIG}', document) @@ websearch_to_tsquery('{POSTGRES_CONFIG}', %s) "
+                f'{restriction}'
+                f"ORDER BY ts_rank(to_tsvector('{POSTGRES_CONFIG}', document), websearch_to_tsquery('{POSTGRES_CONFIG}', %s)) DESC "
+                'LIMIT %s',
+                [search] + restriction_params + [search, limit]
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    condition = Q()
+    for term in terms:
+        condition = condition & Q(document__icontains=term)
+    documents = TicketSearchDocument.objects.filter(condition)
+    if queryset is not None:
+        documents = documents.filter(ticket__in=queryset.order_by().values('pk'))
+    return list(documents.values_list('ticket_id', flat=True)[:limit])
+
+
+def search_tickets(search, queryset=None, limit=None):
+    """Filter a ticket queryset to the tickets matching search, ordered by rank
+
+    Args:
+        search: The text to search for
+        queryset: The tickets to search within.  Defaults to all tickets
+        limit: The most matches to return.  Defaults to LIBTEKTICKET_SEARCH_LIMIT or 500
+
+    """
+
+    if limit is None:
+        limit = getattr(settings, 'LIBTEKTICKET_SEARCH_LIMIT', 500)
+
+    ticket_ids = search_ticket_ids(search, limit, queryset)
+    if queryset is None:
+        queryset = Ticket.objects.all()
+    if not ticket_ids:
+        return queryset.none()
+
+    return queryset.filter(pk__in=ticket_ids).order_by(
+        Case(
+            *[When(pk=ticket_id, then=Value(position)) for position, ticket_id in enumerate(ticket_ids)],
+            output_field=IntegerField(),
+        )
+    )
@@ -0,0 +1,142 @@
+import threading
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+from libtekin.models import Item, Location
+from tougshire_vistas.models import Vista
+
+from . import events, metrics
+from .forms import clear_item_choices
+from .models import Technician, Ticket, TicketNote, bump_related_labels_version, clear_vista_cache
+from .search import queue_ticket_index
+
+
+@receiver(post_save, sender=Technician)
+@receiver(post_delete, sender=Technician)
+def technician_changed(sender, instance, **kwargs):
+    # cleared after commit, so a request made before then can't cache the old technicians again
+    transaction.on_commit(Technician.objects.clear_cache)
+    transaction.on_commit(bump_related_labels_version)
+
+
+@receiver(post_save, sender=get_user_model())
+@receiver(post_delete, sender=get_user_model())
+def user_changed(sender, instance, update_fields=None, **kwargs):
+    # users are saved on every login, so only a technician's user clears the cache
+    if instance.pk in Technician.objects.get_user_ids():
+        transaction.on_commit(Technician.objects.clear_cache)
+    if update_fields is None or set(update_fields) != {'last_login'}:
+        transaction.on_commit(bump_related_labels_version)
+
+
+@receiver(post_save, sender=Item)
+@receiver(post_delete, sender=Item)
+@receiver(post_save, sender=Location)
+@receiver(post_delete, sender=Location)
+def item_changed(sender, instance, **kwargs):
+    # cleared after commit, so a request made before then can't cache the old choices again
+    transaction.on_commit(clear_item_choices)
+    transaction.on_commit(bump_related_labels_version)
+
+
+post_save.connect(item_changed, sender=Item._meta.get_field('assignee').related_model)
+post_delete.connect(item_changed, sender=Item._meta.get_field('assignee').related_model)
+
+
+@receiver(post_save, sender=Vista)
+@receiver(post_delete, sender=Vista)
+def vista_changed(sender, instance, **kwargs):
+    # cleared after commit, so a request made before then can't cache the old vistas under the new generation
+    transaction.on_commit(clear_vista_cache)
+
+
+@receiver(post_save, sender=Ticket)
+@receiver(post_delete, sender=Ticket)
+def ticket_changed(sender, instance, **kwargs):
+    # bumped after commit, so a page rendered from the old rows can't be cached under the new version
+    pk = instance.pk
+    transaction.on_commit(lambda: Ticket.bump_cache_versions([pk]))
+
+
+@receiver(post_save, sender=Ticket)
+def ticket_saved(sender, instance, created, **kwargs):
+    queue_ticket_index(instance.pk)
+    events.publish(events.TICKET_CREATED if created else events.TICKET_UPDATED, instance)
+
+
+@receiver(pre_save, sender=Ticket)
+def ticket_saving(sender, instance, **kwargs):
+    instance._metrics_previous = metrics.get_snapshot(instance.pk) if instance.pk else None
+    if instance._metrics_previous is not None:
+        # first_note_at is kept by the note signals, so a stale copy on this instance must not overwrite it
+        instance.first_note_at = instance._metrics_previous['first_note_at']
+
+    # resolved_at is only set when a ticket becomes resolved, so resolved tickets
+    # saved before it was tracked keep None instead of getting the time of their next edit
+    if not instance.is_resolved:
+        instance.resolved_at = None
+    elif instance._metrics_previous is not None and instance._metrics_previous['is_resolved']:
+        instance.resolved_at = instance._metrics_previous['resolved_at']
+    elif instance.resolved_at is None:
+        instance.resolved_at = timezone.now()
+
+
+@receiver(post_save, sender=Ticket)
+def ticket_metrics_saved(sender, instance, **kwargs):
+    metrics.record_ticket_change(getattr(instance, '_metrics_previous', None), metrics.get_values(instance))
+
+
+# the tickets this thread is deleting, whose notes are deleted first by the cascade
+deleting = threading.local()
+
+
+def get_deleting_ticket_ids():
+    if not hasattr(deleting, 'ticket_ids'):
+        deleting.ticket_ids = set()
+    return deleting.ticket_ids
+
+
+@receiver(pre_delete, sender=Ticket)
+def ticket_deleting(sender, instance, **kwargs):
+    # pre_delete is sent before the cascade deletes any notes, so the snapshot still has first_note_at
+    instance._metrics_previous = metrics.get_snapshot(instance.pk)
+    get_deleting_ticket_ids().add(instance.pk)
+
+
+@receiver(post_delete, sender=Ticket)
+def ticket_metrics_deleted(sender, instance, **kwargs):
+    get_deleting_ticket_ids().discard(instance.pk)
+    metrics.record_ticket_deleted(getattr(instance, '_metrics_previous', None) or metrics.get_values(instance))
+
+
+@receiver(post_save, sender=TicketNote)
+def ticketnote_saved(sender, instance, created, **kwargs):
+    if created:
+        Ticket.objects.filter(pk=instance.ticket_id).add_note_activity(instance.when)
+        metrics.refresh_first_note(instance.ticket_id, instance.when)
+        events.publish(events.NOTE_ADDED, instance.ticket, note=instance.pk)
+    else:
+        Ticket.objects.filter(pk=instance.ticket_id).refresh_summaries()
+        Ticket.objects.filter(pk=instance.ticket_id).touch()
+        metrics.refresh_first_note(instance.ticket_id)
+
+
+@receiver(post_delete, sender=TicketNote)
+def ticketnote_deleted(sender, instance, **kwargs):
+    if instance.ticket_id in get_deleting_ticket_ids():
+        # the ticket's whole contribution, first note included, is removed when the ticket is
+        return
+    Ticket.objects.filter(pk=instance.ticket_id).refresh_summaries()
+    Ticket.objects.filter(pk=instance.ticket_id).touch()
+    metrics.refresh_first_note(instance.ticket_id)
+
+
+@receiver(post_save, sender=TicketNote)
+@receiver(post_delete, sender=TicketNote)
+def ticketnote_changed(sender, instance, **kwargs):
+    ticket_id = instance.ticket_id
+    transaction.on_commit(lambda: Ticket.bump_cache_versions([ticket_id]))
+    queue_ticket_index(instance.ticket_id)
@@ -0,0 +1,280 @@
+import json
+from datetime import datetime, timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models import F
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from ..models import APIToken, Technician, Ticket, TicketNote
+
+
+class TicketAPITests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='admin', password='admin', is_superuser=True)
+        cls.technician = Technician.objects.create(name='Pat')
+        for number in range(5):
+            Ticket.objects.create(short_description=f'Ticket {number}', technician=cls.technician)
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.login(username='admin', password='admin')
+
+    def test_sparse_fields(self):
+        response = self.client.get(reverse('libtekticket:api-ticket-list'), {'fields': 'id,short_description'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.json()['results'][0]), {'id', 'short_description'})
+
+    def test_unknown_field(self):
+        response = self.client.get(reverse('libtekticket:api-ticket-list'), {'fields': 'id,password'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_related_fields_are_joined(self):
+        self.client.get(reverse('libtekticket:api-ticket-list'))
+        with self.assertNumQueries(3):
+            # the session, the user and the page
+            response = self.client.get(reverse('libtekticket:api-ticket-list'), {'fields': 'id,technician', 'limit': 10})
+        self.assertEqual(response.json()['results'][0]['technician'], {'id': self.technician.pk, 'name': 'Pat'})
+
+    def test_cursor_pages(self):
+        first = self.client.get(reverse('libtekticket:api-ticket-list'), {'limit': 3}).json()
+        self.assertEqual(len(first['results']), 3)
+        second = self.client.get(first['next']).json()
+        self.assertEqual(len(second['results']), 2)
+        self.assertIsNone(second['next'])
+        ids = [ticket['id'] for ticket in first['results'] + second['results']]
+        self.assertEqual(len(set(ids)), 5)
+
+    def test_list_not_modified_until_change(self):
+        url = reverse('libtekticket:api-ticket-list')
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            Ticket.objects.create(short_description='Another')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_detail_not_modified_until_note(self):
+        ticket = Ticket.objects.first()
+        url = reverse('libtekticket:api-ticket-detail', kwargs={'pk': ticket.pk})
+        response = self.client.get(url)
+        self.assertIn('Last-Modified', response)
+        with self.assertNumQueries(3):
+            # the session, the user and the ticket
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            TicketNote.objects.create(ticket=ticket, maintext='Looking at it')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+    def test_deleted_not_modified(self):
+        ticket = Ticket.objects.first()
+        note = TicketNote.objects.create(ticket=ticket, maintext='Looking at it')
+        urls = [
+            reverse('libtekticket:api-ticket-detail', kwargs={'pk': ticket.pk}),
+            reverse('libtekticket:api-ticketnote-list', kwargs={'ticketpk': ticket.pk}),
+            reverse('libtekticket:api-ticketnote-detail', kwargs={'ticketpk': ticket.pk, 'pk': note.pk}),
+        ]
+        etags = [self.client.get(url)['ETag'] for url in urls]
+        # the versions are bumped on commit, so in a test they are kept and only the ticket is gone
+        ticket.delete()
+        for url, etag in zip(urls, etags):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 404)
+
+    def test_list_modified_by_renamed_technician(self):
+        url = reverse('libtekticket:api-ticket-list')
+        etag = self.client.get(url)['ETag']
+        sparse_etag = self.client.get(url, {'fields': 'id,short_description'})['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.technician.name = 'Pat Jones'
+            self.technician.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][0]['technician']['name'], 'Pat Jones')
+        # responses without related objects don't show the name
+        self.assertEqual(self.client.get(url, {'fields': 'id,short_description'}, HTTP_IF_NONE_MATCH=sparse_etag).status_code, 304)
+
+    def test_login_leaves_etag(self):
+        url = reverse('libtekticket:api-ticket-detail', kwargs={'pk': Ticket.objects.first().pk})
+        etag = self.client.get(url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Client().login(username='admin', password='admin')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_create_and_patch(self):
+        response = self.client.post(
+            reverse('libtekticket:api-ticket-list'),
+            json.dumps({'short_description': 'New printer', 'urgency': 2, 'donot_send': True}),
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 201)
+        pk = response.json()['id']
+
+        response = self.client.patch(
+            reverse('libtekticket:api-ticket-detail', kwargs={'pk': pk}),
+            json.dumps({'is_resolved': True, 'donot_send': True}),
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200)
+        ticket = Ticket.objects.get(pk=pk)
+        self.assertTrue(ticket.is_resolved)
+        self.assertEqual(ticket.urgency, 2)
+        self.assertEqual(ticket.submitted_by, self.user)
+
+    def test_invalid_data(self):
+        response = self.client.post(
+            reverse('libtekticket:api-ticket-list'),
+            json.dumps({'urgency': 9}),
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('short_description', response.json()['errors'])
+
+    def test_notes(self):
+        ticket = Ticket.objects.first()
+        url = reverse('libtekticket:api-ticketnote-list', kwargs={'ticketpk': ticket.pk})
+        response = self.client.post(url, json.dumps({'maintext': 'Ordered toner', 'donot_send': True}), content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.client.get(url).json()['results'][0]['maintext'], 'Ordered toner')
+
+    def test_create_uses_default_recipients(self):
+        self.user.email = 'admin@example.com'
+        self.user.save()
+        tech_user = get_user_model().objects.create_user(username='pat', email='pat@example.com')
+        Technician.objects.create(name='Pat Jones', user=tech_user)
+        response = self.client.post(
+            reverse('libtekticket:api-ticket-list'),
+            json.dumps({'short_description': 'New printer', 'donot_send': True}),
+            content_type='application/json',
+        )
+        ticket = Ticket.objects.get(pk=response.json()['id'])
+        self.assertEqual(sorted(ticket.subscribers.values_list('email', flat=True)), ['admin@example.com', 'pat@example.com'])
+
+    def test_note_detail(self):
+        note = TicketNote.objects.create(ticket=Ticket.objects.first(), maintext='Ordered toner')
+        url = reverse('libtekticket:api-ticketnote-detail', kwargs={'ticketpk': note.ticket_id, 'pk': note.pk})
+        self.assertEqual(self.client.get(url).json()['maintext'], 'Ordered toner')
+
+        response = self.client.patch(url, json.dumps({'maintext': 'Toner arrived', 'donot_send': True}), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(TicketNote.objects.get(pk=note.pk).maintext, 'Toner arrived')
+
+        response = self.client.delete(url, json.dumps({'donot_send': True}), content_type='application/json')
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(TicketNote.objects.filter(pk=note.pk).exists())
+
+    def test_technicians(self):
+        response = self.client.get(reverse('libtekticket:api-technician-list'), {'fields': 'id,name'})
+        self.assertEqual(response.json()['results'], [{'id': self.technician.pk, 'name': 'Pat'}])
+
+    def test_technician_writes(self):
+        response = self.client.post(reverse('libtekticket:api-technician-list'), json.dumps({'name': 'Sam'}), content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        url = reverse('libtekticket:api-technician-detail', kwargs={'pk': response.json()['id']})
+
+        response = self.client.patch(url, json.dumps({'is_current': False}), content_type='application/json')
+        self.assertEqual(response.json()['is_current'], False)
+        self.assertEqual(response.json()['name'], 'Sam')
+
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertFalse(Technician.objects.filter(name='Sam').exists())
+
+
+class APIAuthenticationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='admin', password='admin', is_superuser=True)
+        cls.token, cls.key = APIToken.objects.create_token(cls.user, 'Kiosk')
+
+    def setUp(self):
+        self.client = Client(enforce_csrf_checks=True)
+        self.url = reverse('libtekticket:api-ticket-list')
+        self.body = json.dumps({'short_description': 'New printer', 'donot_send': True})
+
+    def test_session_write_needs_csrf_token(self):
+        self.client.login(username='admin', password='admin')
+        response = self.client.post(self.url, self.body, content_type='application/json')
+        self.assertEqual(response.status_code, 403)
+        self.assertIn('CSRF', response.json()['error'])
+        self.assertFalse(Ticket.objects.exists())
+
+    def test_session_write_with_csrf_token(self):
+        self.client.login(username='admin', password='admin')
+        self.client.get(reverse('libtekticket:ticket-create'))
+        csrf_token = self.client.cookies['csrftoken'].value
+        response = self.client.post(self.url, self.body, content_type='application/json', HTTP_X_CSRFTOKEN=csrf_token)
+        self.assertEqual(response.status_code, 201)
+
+    def test_token_write(self):
+        response = self.client.post(self.url, self.body, content_type='application/json', HTTP_AUTHORIZATION=f'Token {self.key}')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Ticket.objects.get().submitted_by, self.user)
+
+    def test_invalid_token(self):
+        response = self.client.get(self.url, HTTP_AUTHORIZATION='Token not-a-key')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response['WWW-Authenticate'], 'Token')
+        self.assertIn('error', response.json())
+
+    def test_token_without_permission(self):
+        token, key = APIToken.objects.create_token(get_user_model().objects.create_user(username='kiosk'))
+        response = self.client.post(self.url, self.body, content_type='application/json', HTTP_AUTHORIZATION=f'Token {key}')
+        self.assertEqual(response.status_code, 403)
+        self.assertIn('error', response.json())
+
+    def test_key_stored_as_hash(self):
+        self.assertNotEqual(self.token.key_hash, self.key)
+        self.assertEqual(APIToken.objects.get_user(self.key), self.user)
+
+
+@override_settings(LIBTEKTICKET_CHANGES_LAG=0)
+class TicketChangesAPITests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='admin', password='admin', is_superuser=True)
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.login(username='admin', password='admin')
+        self.tickets = [Ticket.objects.create(short_description=f'Ticket {number}') for number in range(3)]
+
+    def get_changes(self, since=''):
+        return self.client.get(reverse('libtekticket:api-ticket-changes'), {'since': since, 'fields': 'id'}).json()
+
+    def test_only_changes_after_cursor(self):
+        changes = self.get_changes()
+        self.assertEqual([ticket['id'] for ticket in changes['results']], [ticket.pk for ticket in self.tickets])
+
+        unchanged = self.get_changes(changes['since'])
+        self.assertEqual(unchanged['results'], [])
+        self.assertEqual(unchanged['since'], changes['since'])
+
+        TicketNote.objects.create(ticket=self.tickets[0], maintext='Looking at it')
+        self.assertEqual(self.get_changes(changes['since'])['results'], [{'id': self.tickets[0].pk}])
+
+    def test_bulk_update_counts_as_change(self):
+        since = self.get_changes()['since']
+        Ticket.objects.filter(pk=self.tickets[1].pk).touch()
+        self.assertEqual(self.get_changes(since)['results'], [{'id': self.tickets[1].pk}])
+
+    @override_settings(LIBTEKTICKET_CHANGES_LAG=60)
+    def test_recent_changes_held_back(self):
+        self.assertEqual(self.get_changes()['results'], [])
+        Ticket.objects.filter(pk=self.tickets[0].pk).update(updated_at=F('updated_at') - timedelta(minutes=2))
+        self.assertEqual(self.get_changes()['results'], [{'id': self.tickets[0].pk}])
+
+    @override_settings(USE_TZ=False)
+    def test_naive_datetimes(self):
+        Ticket.objects.filter(pk__in=[ticket.pk for ticket in self.tickets]).update(updated_at=datetime.now() - timedelta(minutes=2))
+        changes = self.get_changes()
+        self.assertEqual([ticket['id'] for ticket in changes['results']], [ticket.pk for ticket in self.tickets])
+
+        Ticket.objects.filter(pk=self.tickets[2].pk).touch()
+        with override_settings(LIBTEKTICKET_CHANGES_LAG=60):
+            self.assertEqual(self.get_changes(changes['since'])['results'], [])
+        self.assertEqual(self.get_changes(changes['since'])['results'], [{'id': self.tickets[2].pk}])
@@ -0,0 +1,51 @@
+from django.contrib.auth import get_user_model
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from ..models import History, OutboundMail, Technician, Ticket, TicketBacklog
+
+
+class TicketBulkUpdateTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='admin', password='admin', is_superuser=True)
+        cls.technician = Technician.objects.create(name='Pat')
+
+    def setUp(self):
+        self.client = Client()
+        self.client.login(username='admin', password='admin')
+        self.tickets = [
+            Ticket.objects.create(short_description='Printer jammed', recipient_emails='one@example.com, two@example.com'),
+            Ticket.objects.create(short_description='Projector dim', recipient_emails='one@example.com'),
+            Ticket.objects.create(short_description='Scanner offline'),
+        ]
+
+    def post_bulk(self, **data):
+        return self.client.post(reverse('libtekticket:ticket-bulk'), {
+            'tickets': [ticket.pk for ticket in self.tickets],
+            **data,
+        })
+
+    def test_assign(self):
+        response = self.post_bulk(action='assign', technician=self.technician.pk)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Ticket.objects.filter(technician=self.technician).count(), 3)
+        self.assertEqual(History.objects.filter(fieldname='technician').count(), 3)
+        self.assertEqual(TicketBacklog.objects.get(technician=self.technician).open_count, 3)
+
+    def test_one_mail_per_recipient(self):
+        self.post_bulk(action='urgency', urgency=1)
+        self.assertEqual(sorted(mail.recipients for mail in OutboundMail.objects.all()), ['one@example.com', 'two@example.com'])
+        self.assertIn('Projector dim', OutboundMail.objects.get(recipients='one@example.com').message)
+
+    def test_resolve_skips_resolved_tickets(self):
+        Ticket.objects.filter(pk=self.tickets[0].pk).update(is_resolved=True)
+        self.post_bulk(action='resolve', donot_send='on')
+        self.assertEqual(History.objects.filter(fieldname='is_resolved').count(), 2)
+        self.assertFalse(Ticket.objects.filter(is_resolved=True, resolved_at__isnull=True).exclude(pk=self.tickets[0].pk).exists())
+        self.assertFalse(OutboundMail.objects.exists())
+
+    def test_assign_requires_technician(self):
+        self.post_bulk(action='assign')
+        self.assertFalse(Ticket.objects.filter(technician__isnull=False).exists())
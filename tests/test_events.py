@@ -0,0 +1,79 @@
+import threading
+
+from django.contrib.auth import get_user_model
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from .. import events
+from ..models import Ticket, TicketNote
+
+
+class InProcessBackendTests(TestCase):
+
+    def test_since(self):
+        backend = events.InProcessBackend(max_events=2)
+        for ticket in range(3):
+            backend.publish({'kind': events.TICKET_CREATED, 'ticket': ticket})
+        self.assertEqual([event['id'] for event in backend.since(0)], [2, 3])
+        self.assertEqual(backend.last_id(), 3)
+
+    def test_wait_wakes_on_publish(self):
+        backend = events.InProcessBackend()
+        timer = threading.Timer(0.05, backend.publish, [{'kind': events.TICKET_UPDATED, 'ticket': 1}])
+        timer.start()
+        self.assertEqual([event['ticket'] for event in backend.wait(0, 5)], [1])
+
+    def test_wait_times_out(self):
+        self.assertEqual(events.InProcessBackend().wait(0, 0.01), [])
+
+    def test_ids_past_the_last_start_again(self):
+        backend = events.InProcessBackend()
+        backend.publish({'kind': events.TICKET_CREATED, 'ticket': 1})
+        self.assertEqual([event['ticket'] for event in backend.since(500)], [1])
+        self.assertEqual([event['ticket'] for event in backend.wait(500, 5)], [1])
+
+
+class TicketEventTests(TransactionTestCase):
+
+    def setUp(self):
+        events.get_backend.cache_clear()
+        get_user_model().objects.create_user(username='admin', password='admin', is_superuser=True)
+        self.client = Client()
+        self.client.login(username='admin', password='admin')
+
+    def tearDown(self):
+        events.get_backend.cache_clear()
+
+    def test_saves_publish_after_commit(self):
+        backend = events.get_backend()
+        ticket = Ticket.objects.create(short_description='Printer jammed')
+        ticket.urgency = 1
+        ticket.save()
+        TicketNote.objects.create(ticket=ticket, maintext='Looking at it')
+        self.assertEqual(
+            [event['kind'] for event in backend.since(0)],
+            [events.TICKET_CREATED, events.TICKET_UPDATED, events.NOTE_ADDED],
+        )
+
+    def test_long_poll(self):
+        response = self.client.get(reverse('libtekticket:ticket-events-poll'))
+        last_id = response.json()['last_id']
+        Ticket.objects.create(short_description='Printer jammed')
+        response = self.client.get(reverse('libtekticket:ticket-events-poll'), {'after': last_id, 'timeout': 0})
+        self.assertEqual([event['short_description'] for event in response.json()['events']], ['Printer jammed'])
+
+    def test_stream_sends_events_as_they_happen(self):
+        backend = events.get_backend()
+        response = self.client.get(reverse('libtekticket:ticket-events'))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        chunks = iter(response.streaming_content)
+        self.assertEqual(next(chunks), b'retry: 3000\n\n')
+        event = backend.publish({'kind': events.TICKET_CREATED, 'ticket': 1})
+        self.assertTrue(next(chunks).startswith(f"id: {event['id']}\nevent: ticket_created\n".encode()))
+        response.close()
+
+    def test_list_polls_unless_stream_enabled(self):
+        stream = 'new EventSource("%s")' % reverse('libtekticket:ticket-events')
+        self.assertNotContains(self.client.get(reverse('libtekticket:ticket-list')), stream)
+        with override_settings(LIBTEKTICKET_EVENT_STREAM=True):
+            self.assertContains(self.client.get(reverse('libtekticket:ticket-list')), stream)
@@ -0,0 +1,42 @@
+from django.core.cache import cache
+from django.test import TestCase
+from libtekin.models import Item, Location
+
+from ..forms import ITEM_CHOICES_CACHE_KEY, TicketForm
+
+
+class ItemChoicesCacheTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.location = Location.objects.create(short_name='Main', full_name='Main Library')
+        cls.assignee = Item._meta.get_field('assignee').related_model.objects.create(friendly_name='Pat', full_name='Pat Jones')
+        for number in range(3):
+            Item.objects.create(primary_id=f'LAP-{number:03}', common_name='Laptop', home=cls.location, assignee=cls.assignee)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_form_makes_one_item_query(self):
+        with self.assertNumQueries(1):
+            form = TicketForm()
+        self.assertEqual(len(form.fields['item'].choices), 4)
+        with self.assertNumQueries(0):
+            TicketForm()
+
+    def test_saves_clear_choices(self):
+        for obj in [Item.objects.first(), self.location, self.assignee]:
+            TicketForm()
+            self.assertIsNotNone(cache.get(ITEM_CHOICES_CACHE_KEY))
+            with self.captureOnCommitCallbacks(execute=True):
+                obj.save()
+            self.assertIsNone(cache.get(ITEM_CHOICES_CACHE_KEY))
+
+    def test_choices_cleared_on_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            Item.objects.create(primary_id='PRN-001', common_name='Printer')
+            # another request, which can't see the new item until the commit, caches the old choices
+            cache.set(ITEM_CHOICES_CACHE_KEY, [])
+        for callback in callbacks:
+            callback()
+        self.assertEqual(len(TicketForm().fields['item'].choices), 5)
@@ -0,0 +1,97 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import History, Ticket, TicketNote
+
+
+class TicketHistoryTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='admin', password='admin', is_superuser=True)
+
+    def setUp(self):
+        self.client = Client()
+        self.client.login(username='admin', password='admin')
+        self.ticket = Ticket.objects.create(short_description='Printer jammed', urgency=4)
+
+    def post_update(self, **changes):
+        data = {
+            'item': '',
+            'location': '',
+            'short_description': self.ticket.short_description,
+            'long_description': self.ticket.long_description,
+            'urgency': self.ticket.urgency,
+            'technician': '',
+            'recipient_emails': '',
+            'resolution_notes': '',
+            'donot_send': 'on',
+            'ticketnote_set-TOTAL_FORMS': 0,
+            'ticketnote_set-INITIAL_FORMS': 0,
+            'ticketnote_set-MIN_NUM_FORMS': 0,
+            'ticketnote_set-MAX_NUM_FORMS': 1000,
+            **changes,
+        }
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('libtekticket:ticket-update', kwargs={'pk': self.ticket.pk}), data)
+        self.assertEqual(response.status_code, 302)
+        return [query['sql'] for query in queries if query['sql'].startswith('INSERT') and History._meta.db_table in query['sql']]
+
+    def test_one_field_one_insert(self):
+        inserts = self.post_update(urgency=2)
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(History.objects.get().fieldname, 'urgency')
+        self.assertEqual(History.objects.get().old_value, '4')
+
+    def test_many_fields_one_insert(self):
+        inserts = self.post_update(
+            urgency=2,
+            short_description='Printer still jammed',
+            long_description='Paper is stuck in tray 2',
+            resolution_notes='Waiting for parts',
+        )
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(History.objects.filter(modelname='ticket', objectid=self.ticket.pk).count(), 4)
+
+    def test_new_note_recorded_in_same_insert(self):
+        inserts = self.post_update(**{
+            'urgency': 2,
+            'ticketnote_set-TOTAL_FORMS': 1,
+            'ticketnote_set-0-when': '2022-01-01',
+            'ticketnote_set-0-maintext': 'Ordered a new roller',
+        })
+        self.assertEqual(len(inserts), 1)
+        self.assertTrue(History.objects.filter(modelname='ticketnote', fieldname='maintext').exists())
+
+
+class HistoryLabelTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        histories = []
+        for number in range(50):
+            ticket = Ticket.objects.create(short_description=f'Ticket {number}')
+            note = TicketNote.objects.create(ticket=ticket, maintext=f'Note {number}')
+            histories.append(History(modelname='ticket', objectid=ticket.pk, fieldname='urgency', new_value='2'))
+            histories.append(History(modelname='ticketnote', objectid=note.pk, fieldname='maintext', new_value=note.maintext))
+        History.objects.bulk_create(histories)
+
+    def test_labels_fetched_once_per_model(self):
+        with self.assertNumQueries(3):
+            labels = [str(history) for history in History.objects.with_object_labels()]
+        self.assertEqual(len(labels), 100)
+        self.assertTrue(any('[Ticket 7]' in label for label in labels))
+        self.assertTrue(any('[Note 7]' in label for label in labels))
+
+    def test_labels_on_a_page(self):
+        with self.assertNumQueries(3):
+            labels = [str(history) for history in History.objects.with_object_labels().order_by('pk')[:20]]
+        self.assertEqual(len(labels), 20)
+
+    def test_missing_object(self):
+        History.objects.create(modelname='ticket', objectid=0, fieldname='urgency', new_value='2')
+        history = History.objects.with_object_labels().get(objectid=0)
+        self.assertIn(': ticket: 0 [urgency]', str(history))
@@ -0,0 +1,48 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Permission
+from django.test import Client, TestCase
+from django.urls import reverse
+from libtekin.models import Item
+
+
+class ItemSearchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='tech', password='tech')
+        cls.user.user_permissions.add(Permission.objects.get(content_type__app_label='libtekticket', codename='change_ticket'))
+        Item.objects.create(primary_id='LAP-001', common_name='Laptop')
+        Item.objects.create(primary_id='PRN-001', common_name='Office Printer')
+        Item.objects.create(primary_id='XLAP-002', common_name='Projector')
+        for number in range(120):
+            Item.objects.create(primary_id=f'MON-{number:03}', common_name='Monitor')
+
+    def setUp(self):
+        self.client = Client()
+        self.client.login(username='tech', password='tech')
+
+    def get_results(self, **params):
+        response = self.client.get(reverse('libtekticket:item-search'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results']
+
+    def test_change_permission_is_enough(self):
+        self.assertEqual(len(self.get_results(q='LAP')), 1)
+
+    def test_no_permission(self):
+        get_user_model().objects.create_user(username='other', password='other')
+        client = Client()
+        client.login(username='other', password='other')
+        self.assertEqual(client.get(reverse('libtekticket:item-search'), {'q': 'LAP'}).status_code, 403)
+
+    def test_primary_id_prefix_and_name_substring(self):
+        # XLAP-002 contains LAP but does not start with it
+        self.assertEqual(len(self.get_results(q='lap')), 1)
+        self.assertEqual(len(self.get_results(q='printer')), 1)
+        self.assertEqual(self.get_results(q='nothing like this'), [])
+
+    def test_limit(self):
+        self.assertEqual(len(self.get_results(q='monitor')), 20)
+        self.assertEqual(len(self.get_results(q='monitor', limit=5)), 5)
+        self.assertEqual(len(self.get_results(q='monitor', limit=500)), 100)
+        self.assertEqual(len(self.get_results(q='monitor', limit='many')), 20)
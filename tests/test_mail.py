@@ -0,0 +1,156 @@
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from ..mailqueue import enqueue_mail, send_queued_mail
+from ..models import OutboundMail, Ticket, TicketNote
+from ..views import render_ticket_mail
+
+
+class FailingConnection:
+
+    def open(self):
+        return True
+
+    def close(self):
+        pass
+
+    def send_messages(self, messages):
+        raise ConnectionRefusedError('mail server unavailable')
+
+
+class StoppingConnection(FailingConnection):
+    """Sends the first message, then stops the run as an interrupted process would"""
+
+    def __init__(self):
+        self.sent = 0
+
+    def send_messages(self, messages):
+        if self.sent:
+            raise KeyboardInterrupt
+        self.sent = self.sent + 1
+        return 1
+
+
+class MailQueueTests(TestCase):
+
+    def test_enqueue_does_not_send(self):
+        enqueue_mail('Subject', 'Message', 'from@example.com', ['one@example.com', 'two@example.com'])
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(OutboundMail.objects.get().get_recipient_list(), ['one@example.com', 'two@example.com'])
+
+    def test_send_queued_mail(self):
+        enqueue_mail('Subject', 'Message', 'from@example.com', ['one@example.com'], html_message='<p>Message</p>')
+        enqueue_mail('Subject Two', 'Message Two', 'from@example.com', ['two@example.com'])
+        self.assertEqual(send_queued_mail(), (2, 0))
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(OutboundMail.objects.filter(status=OutboundMail.STATUS_SENT).count(), 2)
+
+    def test_mail_not_yet_due_is_not_sent(self):
+        queued = enqueue_mail('Subject', 'Message', 'from@example.com', ['one@example.com'])
+        queued.next_attempt = timezone.now() + timedelta(hours=1)
+        queued.save()
+        self.assertEqual(send_queued_mail(), (0, 0))
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_sent_mail_recorded_when_run_stops(self):
+        first = enqueue_mail('Subject', 'Message', 'from@example.com', ['one@example.com'])
+        second = enqueue_mail('Subject Two', 'Message Two', 'from@example.com', ['two@example.com'])
+        with self.assertRaises(KeyboardInterrupt):
+            send_queued_mail(connection=StoppingConnection())
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.status, OutboundMail.STATUS_SENT)
+        self.assertEqual(second.status, OutboundMail.STATUS_SENDING)
+
+        # the interrupted mail is not sent again until the claim times out
+        self.assertEqual(send_queued_mail(), (0, 0))
+        OutboundMail.objects.filter(pk=second.pk).update(next_attempt=timezone.now())
+        self.assertEqual(send_queued_mail(), (1, 0))
+
+    @override_settings(LIBTEKTICKET_MAIL_MAX_ATTEMPTS=2)
+    def test_failed_mail_is_retried_then_dead(self):
+        queued = enqueue_mail('Subject', 'Message', 'from@example.com', ['one@example.com'])
+
+        self.assertEqual(send_queued_mail(connection=FailingConnection()), (0, 1))
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, OutboundMail.STATUS_QUEUED)
+        self.assertEqual(queued.attempts, 1)
+        self.assertGreater(queued.next_attempt, timezone.now())
+
+        OutboundMail.objects.update(next_attempt=timezone.now())
+        send_queued_mail(connection=FailingConnection())
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, OutboundMail.STATUS_DEAD)
+        self.assertIn('mail server unavailable', queued.last_error)
+
+
+class TicketMailViewTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='admin', password='admin', is_superuser=True)
+        cls.ticket = Ticket.objects.create(
+            short_description='Printer jammed',
+            recipient_emails='one@example.com, two@example.com',
+        )
+
+    def add_note(self, client, maintext):
+        client.post(reverse('libtekticket:ticketticketnote-create', kwargs={'ticketpk': self.ticket.pk}), {
+            'maintext': maintext,
+            'when': '2022-01-01',
+        })
+
+    def test_note_create_queues_mail(self):
+        client = Client()
+        client.login(username='admin', password='admin')
+        self.add_note(client, 'Cleared the jam')
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(OutboundMail.objects.get().get_recipient_list(), ['one@example.com', 'two@example.com'])
+
+    def test_notes_within_window_are_one_digest(self):
+        client = Client()
+        client.login(username='admin', password='admin')
+        self.add_note(client, 'Cleared the jam')
+        self.add_note(client, 'Replaced the toner')
+        digest = OutboundMail.objects.get()
+        self.assertEqual(digest.get_change_list(), ['Note added: Cleared the jam', 'Note added: Replaced the toner'])
+        self.assertIn('Replaced the toner', digest.message)
+        self.assertGreater(digest.next_attempt, timezone.now())
+
+    @override_settings(LIBTEKTICKET_MAIL_DIGEST_WINDOW=0)
+    def test_notes_without_window_are_separate(self):
+        client = Client()
+        client.login(username='admin', password='admin')
+        self.add_note(client, 'Cleared the jam')
+        self.add_note(client, 'Replaced the toner')
+        self.assertEqual(OutboundMail.objects.count(), 2)
+
+
+class RenderTicketMailTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='tech')
+        cls.ticket = Ticket.objects.create(short_description='Printer <jammed>', urgency=2)
+
+    def test_notes_fetched_once(self):
+        for number in range(5):
+            TicketNote.objects.create(ticket=self.ticket, maintext=f'Note {number}', submitted_by=self.user)
+        with self.assertNumQueries(1):
+            subject, message, html_message = render_ticket_mail(self.ticket, 'http://testserver/ticket/1/', changes=['Urgency: 2'])
+        self.assertEqual(subject, 'Tech Ticket Updated: Printer <jammed>')
+        self.assertIn('Note 4 -- tech', message)
+        self.assertIn('Changes:\nUrgency: 2', message)
+        self.assertIn('Note 4 -- tech', html_message)
+        self.assertIn('Printer &lt;jammed&gt;', html_message)
+
+    def test_no_notes_section_without_notes(self):
+        subject, message, html_message = render_ticket_mail(self.ticket, 'http://testserver/ticket/1/', is_new=True)
+        self.assertEqual(subject, 'Tech Ticket Submitted: Printer <jammed>')
+        self.assertNotIn('Notes:', message)
+        self.assertNotIn('Notes:', html_message)
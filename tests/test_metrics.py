@@ -0,0 +1,120 @@
+from datetime import datetime, timedelta
+
+from django.forms import model_to_dict
+from django.test import TestCase
+
+from .. import metrics
+from ..forms import TicketForm
+from ..models import Technician, Ticket, TicketBacklog, TicketDailyStats, TicketNote
+
+
+class TicketMetricsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.technician = Technician.objects.create(name='Pat')
+
+    def get_totals(self):
+        return {
+            'backlog': sum(TicketBacklog.objects.values_list('open_count', flat=True)),
+            'opened': sum(TicketDailyStats.objects.values_list('opened', flat=True)),
+            'resolved': sum(TicketDailyStats.objects.values_list('resolved', flat=True)),
+            'first_noted': sum(TicketDailyStats.objects.values_list('first_noted', flat=True)),
+        }
+
+    def test_open_then_resolve(self):
+        ticket = Ticket.objects.create(short_description='Printer jammed', technician=self.technician, when=datetime.now() - timedelta(hours=2))
+        self.assertEqual(self.get_totals(), {'backlog': 1, 'opened': 1, 'resolved': 0, 'first_noted': 0})
+
+        ticket.is_resolved = True
+        ticket.save()
+        self.assertIsNotNone(ticket.resolved_at)
+        self.assertEqual(self.get_totals(), {'backlog': 0, 'opened': 1, 'resolved': 1, 'first_noted': 0})
+
+        row = metrics.get_summary()[0]
+        self.assertEqual(row['label'], 'Pat')
+        self.assertAlmostEqual(row['average_resolution_hours'], 2, places=1)
+
+    def test_reopen_removes_resolution(self):
+        ticket = Ticket.objects.create(short_description='Printer jammed', is_resolved=True)
+        ticket.is_resolved = False
+        ticket.save()
+        self.assertIsNone(ticket.resolved_at)
+        self.assertEqual(self.get_totals(), {'backlog': 1, 'opened': 1, 'resolved': 0, 'first_noted': 0})
+
+    def test_editing_resolved_ticket_keeps_resolved_at(self):
+        ticket = Ticket.objects.create(short_description='Printer jammed', is_resolved=True)
+        Ticket.objects.filter(pk=ticket.pk).update(resolved_at=None)
+        ticket.refresh_from_db()
+        ticket.urgency = 1
+        ticket.save()
+        self.assertIsNone(ticket.resolved_at)
+
+        ticket.is_resolved = False
+        ticket.save()
+        ticket.is_resolved = True
+        ticket.save()
+        self.assertIsNotNone(ticket.resolved_at)
+
+    def test_reassign_moves_backlog(self):
+        ticket = Ticket.objects.create(short_description='Printer jammed')
+        ticket.technician = self.technician
+        ticket.save()
+        self.assertEqual(list(TicketBacklog.objects.filter(open_count__gt=0).values_list('technician', flat=True)), [self.technician.pk])
+
+    def test_first_note(self):
+        ticket = Ticket.objects.create(short_description='Printer jammed')
+        note = TicketNote.objects.create(ticket=ticket, maintext='Looking at it')
+        TicketNote.objects.create(ticket=ticket, maintext='Still looking')
+        ticket.refresh_from_db()
+        self.assertEqual(ticket.first_note_at, TicketNote.objects.get(pk=note.pk).when)
+        self.assertEqual(self.get_totals()['first_noted'], 1)
+
+        ticket.save()
+        self.assertEqual(self.get_totals()['first_noted'], 1)
+
+    def test_stale_ticket_keeps_note_counts(self):
+        ticket = Ticket.objects.create(short_description='Printer jammed', when=datetime.now() - timedelta(hours=2))
+        stale = Ticket.objects.get(pk=ticket.pk)
+        note = TicketNote.objects.create(ticket=ticket, maintext='Looking at it')
+        form = TicketForm(data={**model_to_dict(stale, TicketForm._meta.fields), 'urgency': 1}, instance=stale)
+        self.assertTrue(form.is_valid())
+        form.save(commit=False).save(update_fields=Ticket.get_form_update_fields(form))
+        ticket.refresh_from_db()
+        self.assertEqual(ticket.urgency, 1)
+        self.assertEqual(ticket.note_count, 1)
+        self.assertEqual(ticket.last_activity_at, TicketNote.objects.get(pk=note.pk).when)
+
+    def test_save_deleted_ticket_inserts(self):
+        ticket = Ticket.objects.create(short_description='Printer jammed')
+        Ticket.objects.filter(pk=ticket.pk).delete()
+        ticket.save()
+        self.assertTrue(Ticket.objects.filter(pk=ticket.pk).exists())
+
+    def test_delete(self):
+        ticket = Ticket.objects.create(short_description='Printer jammed')
+        ticket.delete()
+        self.assertEqual(self.get_totals(), {'backlog': 0, 'opened': 0, 'resolved': 0, 'first_noted': 0})
+
+    def test_delete_with_notes(self):
+        ticket = Ticket.objects.create(short_description='Printer jammed', technician=self.technician)
+        TicketNote.objects.create(ticket=ticket, maintext='Looking at it')
+        TicketNote.objects.create(ticket=ticket, maintext='Still looking')
+        Ticket.objects.get(pk=ticket.pk).delete()
+        self.assertEqual(self.get_totals(), {'backlog': 0, 'opened': 0, 'resolved': 0, 'first_noted': 0})
+        self.assertEqual(sum(TicketDailyStats.objects.values_list('first_note_seconds', flat=True)), 0)
+
+    def test_rebuild_matches_incremental(self):
+        Ticket.objects.create(short_description='One', technician=self.technician)
+        resolved = Ticket.objects.create(short_description='Two', is_resolved=True)
+        TicketNote.objects.create(ticket=resolved, maintext='Done')
+        totals = self.get_totals()
+        metrics.rebuild()
+        self.assertEqual(self.get_totals(), totals)
+
+    def test_summary_by_urgency(self):
+        Ticket.objects.create(short_description='Fire', urgency=1)
+        with self.assertNumQueries(2):
+            rows = metrics.get_summary(group_by='urgency')
+        self.assertEqual(rows[0]['label'], '1) Safety Hazard or Work Stoppage')
+        self.assertEqual(rows[0]['backlog'], 1)
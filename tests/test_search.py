@@ -0,0 +1,63 @@
+from unittest import mock
+
+from django.test import TestCase
+
+from .. import search
+from ..models import Ticket, TicketNote, TicketSearchDocument
+
+
+class TicketSearchTests(TestCase):
+
+    def create_ticket(self, **values):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Ticket.objects.create(**values)
+
+    def test_index_updated_after_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            ticket = Ticket.objects.create(short_description='Printer jammed')
+        self.assertFalse(TicketSearchDocument.objects.filter(ticket=ticket).exists())
+        for callback in callbacks:
+            callback()
+        self.assertIn('Printer jammed', TicketSearchDocument.objects.get(ticket=ticket).document)
+
+    def test_notes_and_resolution_notes_searchable(self):
+        noted = self.create_ticket(short_description='Projector dim')
+        with self.captureOnCommitCallbacks(execute=True):
+            TicketNote.objects.create(ticket=noted, maintext='Replaced the lamp')
+        resolved = self.create_ticket(short_description='Scanner offline', resolution_notes='Reseated the cable')
+        self.assertEqual(list(search.search_tickets('lamp')), [noted])
+        self.assertEqual(list(search.search_tickets('cable')), [resolved])
+
+    def test_every_word_must_match(self):
+        ticket = self.create_ticket(short_description='Printer jammed', long_description='Paper stuck in tray two')
+        self.create_ticket(short_description='Printer offline')
+        self.assertEqual(list(search.search_tickets('printer paper')), [ticket])
+        self.assertEqual(list(search.search_tickets('"printer')), list(search.search_tickets('printer')))
+
+    def test_best_match_first(self):
+        if search.get_backend() is None:
+            self.skipTest('matches are only ranked by full text search')
+        self.create_ticket(short_description='Monitor flickers', long_description='Someone mentioned the printer too')
+        best = self.create_ticket(short_description='Printer jammed', long_description='The printer jams on every printer job')
+        self.assertEqual(list(search.search_tickets('printer'))[0], best)
+
+    def test_limit_counts_only_the_searched_tickets(self):
+        for number in range(3):
+            self.create_ticket(short_description=f'Printer {number}', long_description='printer printer printer', is_resolved=True)
+        unresolved = self.create_ticket(short_description='Printer jammed', long_description='Paper stuck in tray two')
+        queryset = Ticket.objects.filter(is_resolved=False)
+        self.assertEqual(list(search.search_tickets('printer', queryset, limit=1)), [unresolved])
+        with mock.patch.object(search, 'get_backend', return_value=None):
+            self.assertEqual(list(search.search_tickets('printer', queryset, limit=1)), [unresolved])
+
+    def test_like_fallback(self):
+        ticket = self.create_ticket(short_description='Printer jammed', long_description='Paper stuck in tray two')
+        self.create_ticket(short_description='Projector dim')
+        with mock.patch.object(search, 'get_backend', return_value=None):
+            self.assertEqual(list(search.search_tickets('paper STUCK')), [ticket])
+            self.assertEqual(list(search.search_tickets('toner')), [])
+
+    def test_backend_found_once(self):
+        search.get_backend()
+        with self.assertNumQueries(0):
+            search.get_backend()
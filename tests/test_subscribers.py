@@ -0,0 +1,33 @@
+from django.contrib.auth import get_user_model
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from ..models import Ticket, TicketSubscriber, parse_emails
+
+
+class TicketSubscriberTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='one', password='one', email='One@example.com', is_superuser=True)
+
+    def test_parse_emails(self):
+        self.assertEqual(parse_emails('one@example.com,\n Two@example.com; one@example.com, nobody'), ['one@example.com', 'two@example.com'])
+
+    def test_subscribers_follow_recipient_emails(self):
+        ticket = Ticket.objects.create(short_description='Printer jammed', recipient_emails='one@example.com, two@example.com')
+        self.assertEqual(list(ticket.subscribers.values_list('email', 'user')), [('one@example.com', self.user.pk), ('two@example.com', None)])
+
+        ticket.recipient_emails = 'two@example.com, three@example.com'
+        ticket.save()
+        self.assertEqual(list(ticket.subscribers.values_list('email', flat=True)), ['two@example.com', 'three@example.com'])
+
+    def test_subscribed_list(self):
+        subscribed = Ticket.objects.create(short_description='Printer jammed', recipient_emails='one@example.com')
+        Ticket.objects.create(short_description='Projector dim', recipient_emails='two@example.com')
+
+        client = Client()
+        client.login(username='one', password='one')
+        response = client.get(reverse('libtekticket:ticket-subscribed'))
+        self.assertEqual(list(response.context['object_list']), [subscribed])
+        self.assertEqual(TicketSubscriber.objects.for_user(self.user).count(), 1)
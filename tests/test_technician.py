@@ -0,0 +1,93 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from ..models import Technician
+
+
+class TechnicianTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tech_user = get_user_model().objects.create(username='tech')
+        cls.other_user = get_user_model().objects.create(username='other')
+        cls.technician = Technician.objects.create(name='Tech', user=cls.tech_user)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_for_user(self):
+        self.assertEqual(list(Technician.objects.for_user(self.tech_user)), [self.technician])
+        self.assertFalse(Technician.objects.for_user(self.other_user).exists())
+
+    def test_is_tech(self):
+        self.assertTrue(Technician.objects.is_tech(self.tech_user))
+        self.assertFalse(Technician.objects.is_tech(self.other_user))
+        self.assertFalse(Technician.objects.is_tech(AnonymousUser()))
+        self.assertTrue(Technician.user_is_tech(self.tech_user))
+
+    def test_is_tech_is_cached(self):
+        Technician.objects.is_tech(self.tech_user)
+        with self.assertNumQueries(0):
+            self.assertTrue(Technician.objects.is_tech(self.tech_user))
+            self.assertFalse(Technician.objects.is_tech(self.other_user))
+
+    def test_cache_cleared_on_save_and_delete(self):
+        self.assertFalse(Technician.objects.is_tech(self.other_user))
+        with self.captureOnCommitCallbacks(execute=True):
+            other_technician = Technician.objects.create(name='Other', user=self.other_user)
+        self.assertTrue(Technician.objects.is_tech(self.other_user))
+        with self.captureOnCommitCallbacks(execute=True):
+            other_technician.delete()
+        self.assertFalse(Technician.objects.is_tech(self.other_user))
+
+    def test_cache_cleared_after_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            Technician.objects.create(name='Other', user=self.other_user)
+            # another request, which can't see the new technician until the commit, caches the old ones
+            cache.set(Technician.objects.user_ids_cache_key, frozenset([self.tech_user.pk]))
+        for callback in callbacks:
+            callback()
+        self.assertTrue(Technician.objects.is_tech(self.other_user))
+
+    @override_settings(LIBTEKTICKET_TECHNICIAN_CACHE_TIMEOUT=0.01)
+    def test_cache_expires(self):
+        Technician.objects.is_tech(self.tech_user)
+        time.sleep(0.05)
+        with self.assertNumQueries(1):
+            Technician.objects.is_tech(self.tech_user)
+
+    def test_default_recipient_emails(self):
+        self.tech_user.email = 'tech@example.com'
+        self.tech_user.save()
+        Technician.objects.create(name='Former', user=self.other_user, is_current=False)
+        self.assertEqual(Technician.objects.default_recipient_emails(), ('tech@example.com',))
+        with self.assertNumQueries(0):
+            Technician.objects.default_recipient_emails()
+
+    def test_default_recipient_emails_cleared_on_user_change(self):
+        self.assertEqual(Technician.objects.default_recipient_emails(), ())
+        self.tech_user.email = 'tech@example.com'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tech_user.save()
+        self.assertEqual(Technician.objects.default_recipient_emails(), ('tech@example.com',))
+
+    def test_default_recipient_emails_cleared_after_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.tech_user.email = 'tech@example.com'
+            self.tech_user.save()
+            # another request, which can't see the new email until the commit, caches the old emails
+            cache.set(Technician.objects.recipient_emails_cache_key, ())
+        for callback in callbacks:
+            callback()
+        self.assertEqual(Technician.objects.default_recipient_emails(), ('tech@example.com',))
+
+    @override_settings(LIBTEKTICKET_TECHNICIAN_CACHE_TIMEOUT=0.01)
+    def test_default_recipient_emails_expire(self):
+        Technician.objects.default_recipient_emails()
+        time.sleep(0.05)
+        with self.assertNumQueries(1):
+            Technician.objects.default_recipient_emails()
@@ -0,0 +1,86 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from libtekin.models import Item
+
+from ..models import Ticket, TicketNote
+
+
+class TicketDetailCacheTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        get_user_model().objects.create_user(username='admin', password='admin', is_superuser=True)
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.login(username='admin', password='admin')
+        self.ticket = Ticket.objects.create(short_description='Printer jammed')
+        self.url = reverse('libtekticket:ticket-detail', kwargs={'pk': self.ticket.pk})
+
+    def test_ticket_save_changes_version(self):
+        self.assertContains(self.client.get(self.url), 'Printer jammed')
+        version = self.ticket.get_cache_version()
+
+        self.ticket.short_description = 'Printer fixed'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ticket.save()
+        self.assertNotEqual(self.ticket.get_cache_version(), version)
+        response = self.client.get(self.url)
+        self.assertContains(response, 'Printer fixed')
+        self.assertNotContains(response, 'Printer jammed')
+
+    def test_note_save_changes_version(self):
+        self.client.get(self.url)
+        version = self.ticket.get_cache_version()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            note = TicketNote.objects.create(ticket=self.ticket, maintext='Ordered a roller')
+        self.assertNotEqual(self.ticket.get_cache_version(), version)
+        self.assertContains(self.client.get(self.url), 'Ordered a roller')
+
+        version = self.ticket.get_cache_version()
+        note.maintext = 'Fitted the new roller'
+        with self.captureOnCommitCallbacks(execute=True):
+            note.save()
+        self.assertNotEqual(self.ticket.get_cache_version(), version)
+        self.assertContains(self.client.get(self.url), 'Fitted the new roller')
+
+    def test_version_changes_on_commit(self):
+        version = self.ticket.get_cache_version()
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.ticket.short_description = 'Printer fixed'
+            self.ticket.save()
+            # a page rendered before the commit is still cached under the old version
+            self.assertEqual(self.ticket.get_cache_version(), version)
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(self.ticket.get_cache_version(), version)
+
+    def test_item_rename_changes_page(self):
+        item = Item.objects.create(primary_id='PRN-001', common_name='Office Printer')
+        self.ticket.item = item
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ticket.save()
+        self.assertContains(self.client.get(self.url), 'Office Printer')
+
+        item.common_name = 'Lobby Printer'
+        with self.captureOnCommitCallbacks(execute=True):
+            item.save()
+        response = self.client.get(self.url)
+        self.assertContains(response, 'Lobby Printer')
+        self.assertNotContains(response, 'Office Printer')
+
+    @override_settings(LIBTEKTICKET_CACHE_VERSION_TIMEOUT=0.01)
+    def test_versions_expire(self):
+        # versions are made for any pk asked for, so they must not be kept forever
+        Ticket(pk=999999).get_cache_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ticket.save()
+        time.sleep(0.05)
+        self.assertIsNone(cache.get(Ticket.get_cache_version_key(999999)))
+        self.assertIsNone(cache.get(Ticket.get_cache_version_key(self.ticket.pk)))
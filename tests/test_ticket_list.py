@@ -0,0 +1,264 @@
+import csv
+from datetime import datetime, timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.paginator import InvalidPage
+from django.db import connection
+from django.core.cache import cache
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import Technician, Ticket, TicketNote, get_vista_cache_key
+from ..pagination import CachedPKPaginator, KeysetPaginator
+from ..views import get_vista_fields
+from tougshire_vistas.models import Vista
+
+
+class TicketListQueryTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='admin', password='admin', is_superuser=True)
+
+    def make_tickets(self, count):
+        for number in range(count):
+            submitted_by = get_user_model().objects.create(username=f'user{Ticket.objects.count()}')
+            technician = Technician.objects.create(name=f'Tech {number}', user=submitted_by)
+            Ticket.objects.create(
+                short_description=f'Ticket {number}',
+                submitted_by=submitted_by,
+                technician=technician,
+            )
+
+    def count_list_queries(self):
+        client = Client()
+        client.login(username='admin', password='admin')
+        # the first request caches the user's vistas
+        client.get(reverse('libtekticket:ticket-list'))
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(reverse('libtekticket:ticket-list'))
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_list_queries_do_not_grow_with_page_size(self):
+        self.make_tickets(2)
+        few = self.count_list_queries()
+        self.make_tickets(28)
+        many = self.count_list_queries()
+        self.assertEqual(few, many)
+
+
+    def test_keyset_pagination_setting(self):
+        self.make_tickets(2)
+        client = Client()
+        client.login(username='admin', password='admin')
+        self.assertIsInstance(client.get(reverse('libtekticket:ticket-list')).context['paginator'], CachedPKPaginator)
+        with override_settings(LIBTEKTICKET_KEYSET_PAGINATION=True):
+            self.assertIsInstance(client.get(reverse('libtekticket:ticket-list')).context['paginator'], KeysetPaginator)
+
+
+class TicketListVistaCacheTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='admin', password='admin', is_superuser=True)
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.login(username='admin', password='admin')
+
+    def get_vista_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('libtekticket:ticket-list'))
+        self.assertEqual(response.status_code, 200)
+        return [query['sql'] for query in queries if Vista._meta.db_table in query['sql']]
+
+    def test_vistas_cached_between_requests(self):
+        self.assertTrue(self.get_vista_queries())
+        self.assertEqual(self.get_vista_queries(), [])
+
+    def test_vista_change_clears_cache(self):
+        self.get_vista_queries()
+        key = get_vista_cache_key(self.user, 'default')
+        with self.captureOnCommitCallbacks(execute=True):
+            Vista.objects.create(user=self.user, model_name='libtekin.ticket', name='Mine')
+        self.assertNotEqual(get_vista_cache_key(self.user, 'default'), key)
+        self.assertTrue(self.get_vista_queries())
+
+    def test_vista_cache_cleared_on_commit(self):
+        key = get_vista_cache_key(self.user, 'default')
+        with self.captureOnCommitCallbacks() as callbacks:
+            Vista.objects.create(user=self.user, model_name='libtekin.ticket', name='Mine')
+            self.assertEqual(get_vista_cache_key(self.user, 'default'), key)
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(get_vista_cache_key(self.user, 'default'), key)
+
+    def test_vista_fields_are_copied(self):
+        self.assertIsNot(get_vista_fields(), get_vista_fields())
+        self.assertEqual(get_vista_fields(), get_vista_fields())
+
+
+class CachedPKPaginatorTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        for number in range(7):
+            Ticket.objects.create(short_description=f'Ticket {number}', urgency=number % 3 + 1)
+
+    def setUp(self):
+        cache.clear()
+
+    def get_paginator(self, max_ids=100):
+        queryset = Ticket.objects.order_by('urgency', 'pk')
+        return CachedPKPaginator(queryset, 3, cache_key='test_pks', max_ids=max_ids)
+
+    def test_pages_match_queryset(self):
+        ordered = list(Ticket.objects.order_by('urgency', 'pk'))
+        paginator = self.get_paginator()
+        self.assertEqual(paginator.count, 7)
+        self.assertEqual([list(paginator.page(number)) for number in [1, 2, 3]], [ordered[:3], ordered[3:6], ordered[6:]])
+
+    def test_cached_list_makes_one_query_per_page(self):
+        self.get_paginator().page(1)
+        paginator = self.get_paginator()
+        with self.assertNumQueries(1):
+            self.assertEqual(paginator.count, 7)
+            self.assertEqual(len(paginator.page(3)), 1)
+
+    def test_deleted_ticket_left_out(self):
+        self.get_paginator().page(1)
+        Ticket.objects.order_by('urgency', 'pk').first().delete()
+        self.assertEqual(len(self.get_paginator().page(1)), 2)
+
+    def test_long_list_caches_count(self):
+        paginator = self.get_paginator(max_ids=5)
+        self.assertEqual(paginator.count, 7)
+        self.assertEqual(cache.get('test_pks'), 7)
+
+        paginator = self.get_paginator(max_ids=5)
+        with self.assertNumQueries(1):
+            self.assertEqual(paginator.count, 7)
+            self.assertEqual(len(paginator.page(3)), 1)
+
+    def test_list_key_changes_with_tickets(self):
+        version = Ticket.get_list_cache_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            Ticket.objects.create(short_description='Another')
+        self.assertNotEqual(Ticket.get_list_cache_version(), version)
+
+    def test_list_read_during_write_not_kept(self):
+        def get_paginator():
+            return CachedPKPaginator(Ticket.objects.order_by('urgency', 'pk'), 3, cache_key=f'test_pks_{Ticket.get_list_cache_version()}')
+
+        self.assertEqual(get_paginator().count, 7)
+        old_pks = cache.get(f'test_pks_{Ticket.get_list_cache_version()}')
+        with self.captureOnCommitCallbacks() as callbacks:
+            Ticket.objects.create(short_description='Another')
+            # another request, which can't see the new ticket until the commit, caches the old ids
+            cache.set(f'test_pks_{Ticket.get_list_cache_version()}', old_pks)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(get_paginator().count, 8)
+
+
+class KeysetPaginatorTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        for number in range(7):
+            Ticket.objects.create(
+                short_description=f'Ticket {number}',
+                urgency=number % 3 + 1,
+                is_resolved=number % 2 == 0,
+                when=datetime(2022, 1, 1) + timedelta(days=number % 4),
+            )
+        cls.ordered = list(Ticket.objects.order_by('is_resolved', '-when', 'urgency', 'pk'))
+
+    def get_paginator(self):
+        return KeysetPaginator(Ticket.objects.all(), 3, ['is_resolved', '-when', 'urgency', 'pk'])
+
+    def test_next_pages_follow_ordering(self):
+        paginator = self.get_paginator()
+        page = paginator.page()
+        seen = list(page)
+        while page.has_next():
+            page = paginator.page(after=page.next_cursor)
+            seen = seen + list(page)
+        self.assertEqual(seen, self.ordered)
+        self.assertFalse(paginator.page().has_previous())
+
+    def test_previous_pages_follow_ordering(self):
+        paginator = self.get_paginator()
+        page = paginator.page(last=True)
+        seen = list(page)
+        while page.has_previous():
+            page = paginator.page(before=page.previous_cursor)
+            seen = list(page) + seen
+        self.assertEqual(seen, self.ordered)
+        self.assertEqual(list(paginator.page(last=True)), self.ordered[-3:])
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(InvalidPage):
+            self.get_paginator().page(after='not a cursor')
+
+
+class TicketSummaryTests(TestCase):
+
+    def setUp(self):
+        self.ticket = Ticket.objects.create(short_description='Printer jammed', when=datetime(2022, 1, 1))
+
+    def test_new_ticket(self):
+        self.assertEqual(self.ticket.note_count, 0)
+        self.assertEqual(self.ticket.last_activity_at, datetime(2022, 1, 1))
+
+    def test_notes_update_summary(self):
+        # compared with the times read back, which are aware or naive as USE_TZ says
+        latest = TicketNote.objects.create(ticket=self.ticket, maintext='One', when=datetime(2022, 1, 3))
+        older = TicketNote.objects.create(ticket=self.ticket, maintext='Two', when=datetime(2022, 1, 2))
+        self.ticket.refresh_from_db()
+        self.assertEqual(self.ticket.note_count, 2)
+        self.assertEqual(self.ticket.last_activity_at, TicketNote.objects.get(pk=latest.pk).when)
+
+        latest.delete()
+        self.ticket.refresh_from_db()
+        self.assertEqual(self.ticket.note_count, 1)
+        self.assertEqual(self.ticket.last_activity_at, TicketNote.objects.get(pk=older.pk).when)
+
+        older.delete()
+        self.ticket.refresh_from_db()
+        self.assertEqual(self.ticket.note_count, 0)
+        self.assertEqual(self.ticket.last_activity_at, self.ticket.when)
+
+
+class TicketListCSVTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='admin', password='admin', is_superuser=True)
+        Ticket.objects.create(short_description='Printer jammed', urgency=2, submitted_by=cls.user)
+
+    def test_csv_export(self):
+        client = Client()
+        client.login(username='admin', password='admin')
+        response = client.get(reverse('libtekticket:ticket-list'), {'make_csv': 'on'})
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertIn('Printer jammed', lines[1])
+        self.assertIn('2) Major Work Impediment', lines[1])
+        self.assertIn('admin', lines[1])
+
+    def test_csv_escapes_formulas(self):
+        Ticket.objects.create(short_description='=HYPERLINK("http://example.com")', long_description='-1+2', resolution_notes='@SUM(A1)')
+        client = Client()
+        client.login(username='admin', password='admin')
+        response = client.get(reverse('libtekticket:ticket-list'), {'make_csv': 'on'})
+        rows = list(csv.reader(b''.join(response.streaming_content).decode().splitlines()))
+        row = next(row for row in rows if 'HYPERLINK' in row[3])
+        self.assertEqual(row[3], '\'=HYPERLINK("http://example.com")')
+        self.assertEqual(row[4], "'-1+2")
+        self.assertEqual(row[10], "'@SUM(A1)")
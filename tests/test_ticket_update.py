@@ -0,0 +1,71 @@
+from datetime import datetime, timedelta
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import Ticket, TicketNote
+
+
+class TicketUpdateNotesTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        get_user_model().objects.create_user(username='admin', password='admin', is_superuser=True)
+        cls.ticket = Ticket.objects.create(short_description='Printer jammed', urgency=4)
+        for number in range(25):
+            TicketNote.objects.create(ticket=cls.ticket, maintext=f'Note {number}', when=datetime(2022, 1, 1) + timedelta(days=number))
+        cls.url = reverse('libtekticket:ticket-update', kwargs={'pk': cls.ticket.pk})
+
+    def setUp(self):
+        self.client = Client()
+        self.client.login(username='admin', password='admin')
+
+    def test_form_holds_only_new_notes(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.context['ticketnotes'].initial_form_count(), 0)
+
+    @override_settings(LIBTEKTICKET_EDIT_EXISTING_NOTES=True)
+    def test_setting_includes_existing_notes(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.context['ticketnotes'].initial_form_count(), 25)
+
+    def test_post_does_not_validate_existing_notes(self):
+        data = {
+            'item': '',
+            'location': '',
+            'short_description': 'Printer still jammed',
+            'long_description': '',
+            'urgency': 4,
+            'technician': '',
+            'recipient_emails': '',
+            'resolution_notes': '',
+            'donot_send': 'on',
+            'ticketnote_set-TOTAL_FORMS': 1,
+            'ticketnote_set-INITIAL_FORMS': 0,
+            'ticketnote_set-MIN_NUM_FORMS': 0,
+            'ticketnote_set-MAX_NUM_FORMS': 1000,
+            'ticketnote_set-0-when': '2022-03-01',
+            'ticketnote_set-0-maintext': 'Ordered a new roller',
+        }
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, data)
+        self.assertEqual(response.status_code, 302)
+        note_selects = [
+            query['sql'] for query in queries
+            if query['sql'].startswith('SELECT') and TicketNote._meta.db_table in query['sql'].split(' WHERE ')[0]
+        ]
+        self.assertEqual(note_selects, [])
+        self.assertEqual(self.ticket.ticketnote_set.count(), 26)
+        self.assertTrue(self.ticket.ticketnote_set.filter(maintext='Note 0').exists())
+
+    def test_existing_notes_paged(self):
+        page = self.client.get(self.url).context['ticketnote_page']
+        self.assertEqual([note.maintext for note in page][:2], ['Note 24', 'Note 23'])
+        self.assertEqual(len(page), 20)
+
+        page = self.client.get(self.url, {'notes_page': 2}).context['ticketnote_page']
+        self.assertEqual(page.number, 2)
+        self.assertEqual([note.maintext for note in page], [f'Note {number}' for number in range(4, -1, -1)])
@@ -1,6 +1,6 @@
 from django.views.generic.base import RedirectView
 from django.urls import path, reverse_lazy
-from . import views
+from . import api, views
 
 app_name = 'libtekticket'
 
@@ -12,5 +12,19 @@ urlpatterns = [
     path('ticket/<int:pk>/detail/', views.TicketDetail.as_view(), name='ticket-detail'),
     path('ticket/<int:pk>/delete/', views.TicketSoftDelete.as_view(), name='ticket-delete'),
     path('ticket/list/', views.TicketList.as_view(), name='ticket-list'),
+    path('ticket/events/', views.TicketEventStream.as_view(), name='ticket-events'),
+    path('ticket/events/poll/', views.TicketEventPoll.as_view(), name='ticket-events-poll'),
+    path('ticket/bulk/', views.TicketBulkUpdate.as_view(), name='ticket-bulk'),
+    path('ticket/subscribed/', views.TicketSubscribedList.as_view(), name='ticket-subscribed'),
     path('ticket/<int:ticketpk>/ticketnote/create', views.TicketTicketNoteCreate.as_view(), name='ticketticketnote-create'),
+    path('item/search/', views.ItemSearch.as_view(), name='item-search'),
+    path('api/tickets/', api.TicketListAPI.as_view(), name='api-ticket-list'),
+    path('api/tickets/changes/', api.TicketChangesAPI.as_view(), name='api-ticket-changes'),
+    path('api/tickets/<int:pk>/', api.TicketDetailAPI.as_view(), name='api-ticket-detail'),
+    path('api/tickets/<int:ticketpk>/notes/', api.TicketNoteListAPI.as_view(), name='api-ticketnote-list'),
+    path('api/tickets/<int:ticketpk>/notes/<int:pk>/', api.TicketNoteDetailAPI.as_view(), name='api-ticketnote-detail'),
+    path('api/technicians/', api.TechnicianListAPI.as_view(), name='api-technician-list'),
+    path('api/technicians/<int:pk>/', api.TechnicianDetailAPI.as_view(), name='api-technician-detail'),
+    path('metrics/', views.TicketMetrics.as_view(), name='ticket-metrics'),
+    path('metrics/json/', views.TicketMetricsJSON.as_view(), name='ticket-metrics-json'),
 ]
@@ -1,5 +1,9 @@
-import sys
+import copy
+import csv
+import time
+from functools import lru_cache
 import urllib
+import django
 from urllib.parse import urlencode
 
 from django.apps import AppConfig
@@ -8,11 +12,19 @@ from django.contrib import messages
 from django.contrib.auth import get_user_model
 from django.contrib.auth.mixins import (PermissionRequiredMixin,
                                         UserPassesTestMixin)
+from django.core.cache import cache
 from django.core.exceptions import FieldError, ObjectDoesNotExist
-from django.core.mail import send_mail
-from django.http import QueryDict
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.core.paginator import InvalidPage, Paginator
+from django.db.models import Q
+from django.http import (Http404, HttpResponseRedirect, JsonResponse, QueryDict,
+                         StreamingHttpResponse)
 from django.shortcuts import render
+from django.template.loader import render_to_string
 from django.urls import reverse, reverse_lazy
+from django.utils import timezone
+from django.views.generic.base import TemplateView, View
 from django.views.generic.detail import DetailView
 from django.views.generic.edit import CreateView, DeleteView, UpdateView
 from django.views.generic.list import ListView
@@ -22,93 +34,296 @@ from tougshire_vistas.views import (delete_vista, get_global_vista,
                                     get_latest_vista, make_vista,
                                     retrieve_vista, default_vista, vista_context_data, make_vista_fields)
 
-from .forms import TicketForm, TicketTicketNoteForm, TicketTicketNoteFormset
-from .models import History, Technician, Ticket, TicketNote
+from .forms import (CSVOptionForm, MetricsForm, TicketBulkForm, TicketForm, TicketTicketNoteForm,
+                    TicketTicketNoteFormset, get_item_choice)
+from . import events, metrics
+from .pagination import CachedPKPaginator, KeysetPaginator
+from .mailqueue import enqueue_mail, get_digest_window, get_pending_digest
+from .search import search_tickets
+from .models import (History, Technician, Ticket, TicketNote, TicketSubscriber, get_related_labels_version,
+                     get_vista_cache_key)
 
 
-def update_history(form, modelname, object, user):
+def get_field_labels(model):
+    return {field.name: field.verbose_name.title(
+    ) for field in model._meta.get_fields() if type(field).__name__[-3:] != 'Rel'}
+
+
+TICKET_LABELS = get_field_labels(Ticket)
+TICKETNOTE_LABELS = get_field_labels(TicketNote)
+
+@lru_cache(maxsize=None)
+def make_ticket_vista_fields():
+    """The ticket fields offered by vistas, which only change when the code does, so worked out once per process"""
+
+    return make_vista_fields(Ticket, rels=True)
+
+
+def get_vista_fields():
+    """A copy of the ticket fields offered by vistas, so a request can't change the fields of later ones"""
+
+    return copy.deepcopy(make_ticket_vista_fields())
+
+
+def get_default_recipient_emails(user):
+    """The recipient_emails of a new ticket: the current technicians and the user submitting it"""
+
+    tech_emails = list(Technician.objects.default_recipient_emails())
+    all_recipient_emails = ( tech_emails + [ user.email ] ) if user.email and user.email not in tech_emails else tech_emails
+    return ",\n".join(all_recipient_emails)
+
+
+def get_history(form, modelname, object, user):
+    """Unsaved History records for each field changed by a form"""
+
+    histories = []
     for fieldname in form.changed_data:
         try:
-            old_value = str(form.initial[fieldname]),
+            old_value = str(form.initial[fieldname])
         except KeyError:
             old_value = None
 
-        history = History.objects.create(
+        histories.append(History(
             user=user,
             modelname=modelname,
             objectid=object.pk,
             fieldname=fieldname,
             old_value=old_value,
             new_value=str(form.cleaned_data[fieldname])
-        )
+        ))
+
+    return histories
+
+
+def get_formset_history(formset, modelname, user):
+    """Unsaved History records for the forms saved by a formset"""
+
+    histories = []
+    for form in formset.forms:
+        if form.instance.pk is not None and form not in formset.deleted_forms:
+            histories = histories + get_history(form, modelname, form.instance, user)
+
+    return histories
+
+
+def update_history(form, modelname, object, user):
+    """Record each field changed by a form with a single insert"""
+
+    return History.objects.bulk_create(get_history(form, modelname, object, user))
+
+
+def describe_changes(form):
+    """A list of the fields changed by a form and their new values, for emails"""
 
-        history.save()
+    changes = []
+    for fieldname in form.changed_data:
+        value = form.cleaned_data.get(fieldname)
+        get_display = getattr(form.instance, f'get_{fieldname}_display', None)
+        if get_display is not None:
+            value = get_display()
+        changes.append(f'{form.fields[fieldname].label}: {value}')
+
+    return changes
+
+
+def describe_note_changes(ticketnotes):
+    """A list of the notes added, changed or deleted by a saved note formset, for emails"""
+
+    return [f'Note added: {note.maintext}' for note in ticketnotes.new_objects] \
+        + [f'Note changed: {note.maintext}' for note, fieldnames in ticketnotes.changed_objects] \
+        + [f'Note deleted: {note.maintext}' for note in ticketnotes.deleted_objects]
+
+
+def render_ticket_mail(ticket, ticket_url, is_new=False, changes=None):
+    """Build the subject, plain text and HTML body of a ticket email
+
+    The notes are fetched once, with their submitters, for both bodies.  The
+    bodies come from the libtekticket/email/ templates, which projects can
+    override
+
+    Returns:
+        A tuple of the subject, the plain text message and the HTML message
+
+    """
+
+    context = {
+        'ticket': ticket,
+        'item': ticket.item,
+        'ticket_url': ticket_url,
+        'is_new': is_new,
+        'changes': changes or [],
+        'notes': list(ticket.ticketnote_set.select_related('submitted_by').order_by('when', 'pk')),
+    }
+
+    mail_subject = ' '.join(render_to_string('libtekticket/email/ticket_subject.txt', context).split())
+    mail_message = render_to_string('libtekticket/email/ticket_message.txt', context).strip()
+    mail_html_message = render_to_string('libtekticket/email/ticket_message.html', context).strip()
 
+    return mail_subject, mail_message, mail_html_message
 
-def send_ticket_mail(ticket, request, is_new=False):
-    """Send an email
+
+def send_ticket_mail(ticket, request, is_new=False, changes=None):
+    """Queue an email about a ticket
+
+    The email is stored in the outbound mail queue and sent later by the
+    libtekticket_sendmail management command, so saving a ticket does not
+    wait on the mail server
+
+    Updates are held for LIBTEKTICKET_MAIL_DIGEST_WINDOW seconds.  Further
+    updates to the same ticket within that time are added to the waiting
+    email, so each recipient gets one digest instead of one email per change
 
     Args:
         ticket: The ticket about which the email is being sent.  Usually self.object or self.object.ticket
         request: A request object.  Usually self.request
         is_new: If this mail is about the creation of a new ticket.  If not then it's an update
+        changes: A list of short descriptions of what changed, included in the email
 
     """
 
-    # if it has no @ sign, assume no emails should be sent
-    if not ticket.recipient_emails.find('@') > 0:
+    mail_recipients = list(ticket.subscribers.values_list('email', flat=True))
+    if not mail_recipients:
         return
 
     ticket_url = request.build_absolute_uri(
         reverse('libtekticket:ticket-detail', kwargs={'pk': ticket.pk}))
 
-    mail_subject_action = "Submitted" if is_new else "Updated"
-    mail_subject = f"Tech Ticket { mail_subject_action }: { ticket.short_description }"
+    mail_from = getattr(settings, 'LIBTEKTICKET_EMAIL_FROM', settings.DEFAULT_FROM_EMAIL)
+
+    changes = list(changes or [])
+    digest_window = get_digest_window()
+
+    with transaction.atomic():
+        digest = None
+        if not is_new and digest_window:
+            digest = get_pending_digest(ticket)
+            if digest is not None:
+                changes = digest.get_change_list() + changes
+
+        mail_subject, mail_message, mail_html_message = render_ticket_mail(ticket, ticket_url, is_new, changes)
+
+        if digest is None:
+            enqueue_mail(
+                mail_subject,
+                mail_message,
+                mail_from,
+                mail_recipients,
+                html_message=mail_html_message,
+                ticket=ticket,
+                changes=changes,
+                delay=None if is_new else digest_window,
+            )
+        else:
+            digest.subject = mail_subject
+            digest.message = mail_message
+            digest.html_message = mail_html_message
+            digest.recipients = ','.join(mail_recipients)
+            digest.changes = '\n'.join(changes)
+            digest.save()
 
-    mail_from = settings.LIBTEKTICKET_EMAIL_FROM if hasattr(
-        settings, 'LIBTEKTICKET_FROM_EMAIL') else settings.DEFAULT_FROM_EMAIL
 
-    mail_message = "\n".join(
-        [
-            f"Title: { ticket.short_description }",
-            f"Urgency: { ticket.get_urgency_display() }",
-            f"Item: { ticket.item }",
-            f"Description: { ticket.long_description }",
-            f"Ticket URL: { ticket_url }",
-        ]
-    )
-    if ticket.ticketnote_set.all().exists:
-        mail_message = mail_message + "\nNotes:\n" + "\n".join([str(note.when) + ': ' + note.maintext + ' -- ' + str(note.submitted_by) for note in ticket.ticketnote_set.all()])
-
-    mail_html_message = "<br>\n".join(
-        [
-            f"Title: { ticket.short_description }",
-            f"Urgency: { ticket.get_urgency_display() }",
-            f"Item: { ticket.item }",
-            f"Description: { ticket.long_description }",
-            f"Ticket URL: <a href=\"{ ticket_url }\">{ ticket_url }</a>"
-        ]
-    )
-    if ticket.ticketnote_set.all().exists:
-        mail_html_message = mail_html_message + "<br>Notes:<br>\n" + "<br>\n".join([str(note.when) + ': ' + note.maintext + ' --' + str(note.submitted_by) for note in ticket.ticketnote_set.all()])
+def update_tickets(ticket_ids, changes, user):
+    """Make the same change to many tickets with one update, recording history and metrics
 
+    Tickets which already have the new values are left alone.  Model signals
+    are not sent by the update, so the history rows, metric rollups and cache
+    versions they would have updated are updated here, in bulk
 
-    mail_recipients = [email.strip() for email in ticket.recipient_emails.split(',')]
+    Args:
+        ticket_ids: The ids of the tickets to change
+        changes: A dict of field names and their new values
+        user: The user making the change
+
+    Returns:
+        A list of the ids of the tickets which were changed
+
+    """
+
+    values = {Ticket._meta.get_field(name).attname: getattr(value, 'pk', value) for name, value in changes.items()}
 
-    try:
-        send_mail(
-            mail_subject,
-            mail_message,
+    with transaction.atomic():
+        previous = {
+            row['pk']: row
+            for row in Ticket.objects.select_for_update().filter(pk__in=ticket_ids).order_by('pk').values('pk', *metrics.SNAPSHOT_FIELDS)
+        }
+        changed = [pk for pk, row in previous.items() if any(row[attname] != value for attname, value in values.items())]
+        if not changed:
+            return []
+
+        current = {pk: dict(previous[pk], **values) for pk in changed}
+        update_values = dict(values)
+        if values.get('is_resolved') is False:
+            update_values['resolved_at'] = None
+            for pk in changed:
+                current[pk]['resolved_at'] = None
+        elif values.get('is_resolved'):
+            # only the tickets which were unresolved get a resolved_at; when
+            # resolving is the whole change, that is every changed ticket
+            now = timezone.now()
+            resolved = [pk for pk in changed if not previous[pk]['is_resolved']]
+            for pk in resolved:
+                current[pk]['resolved_at'] = now
+            if len(resolved) == len(changed):
+                update_values['resolved_at'] = now
+            elif resolved:
+                Ticket.objects.filter(pk__in=resolved).update(resolved_at=now)
+        Ticket.objects.filter(pk__in=changed).update(updated_at=timezone.now(), **update_values)
+
+        History.objects.bulk_create([
+            History(
+                user=user,
+                modelname='ticket',
+                objectid=pk,
+                fieldname=name,
+                old_value=str(previous[pk][Ticket._meta.get_field(name).attname]),
+                new_value=str(value),
+            )
+            for pk in changed
+            for name, value in changes.items()
+        ])
+
+        metrics.record_ticket_changes([(previous[pk], current[pk]) for pk in changed])
+        transaction.on_commit(lambda: Ticket.bump_cache_versions(changed))
+        for ticket in Ticket.objects.filter(pk__in=changed).only('short_description', 'urgency', 'is_resolved'):
+            events.publish(events.TICKET_UPDATED, ticket)
+
+    return changed
+
+
+def send_bulk_ticket_mail(ticket_ids, request, changes):
+    """Queue one email to each recipient of the changed tickets, listing all of their tickets that changed
+
+    Args:
+        ticket_ids: The ids of the changed tickets
+        request: A request object, for the ticket urls
+        changes: A list of short descriptions of what changed
+
+    """
+
+    tickets = Ticket.objects.in_bulk(ticket_ids)
+    recipients = {}
+    for email, ticket_id in TicketSubscriber.objects.filter(ticket_id__in=ticket_ids).values_list('email', 'ticket_id'):
+        recipients.setdefault(email, []).append(tickets[ticket_id])
+
+    mail_from = getattr(settings, 'LIBTEKTICKET_EMAIL_FROM', settings.DEFAULT_FROM_EMAIL)
+
+    for email, recipient_tickets in recipients.items():
+        context = {
+            'tickets': [
+                (ticket, request.build_absolute_uri(reverse('libtekticket:ticket-detail', kwargs={'pk': ticket.pk})))
+                for ticket in sorted(recipient_tickets, key=lambda ticket: ticket.pk)
+            ],
+            'changes': changes,
+        }
+        enqueue_mail(
+            ' '.join(render_to_string('libtekticket/email/bulk_subject.txt', context).split()),
+            render_to_string('libtekticket/email/bulk_message.txt', context).strip(),
             mail_from,
-            mail_recipients,
-            html_message=mail_html_message,
-            fail_silently=False,
+            [email],
+            html_message=render_to_string('libtekticket/email/bulk_message.html', context).strip(),
+            changes=changes,
         )
-    except Exception as e:
-        messages.add_message(request, messages.WARNING, 'There was an error sending emails.')
-        messages.add_message(request, messages.WARNING, e)
 
-        print(e, ' at ', sys.exc_info()[2].tb_lineno)
 
 class TicketCreate(PermissionRequiredMixin, CreateView):
     permission_required = 'libtekticket.add_ticket'
@@ -122,49 +337,47 @@ class TicketCreate(PermissionRequiredMixin, CreateView):
         if self.request.POST:
             context_data['ticketnotes'] = TicketTicketNoteFormset(self.request.POST)
         else:
-            context_data['ticketnotes'] = TicketTicketNoteFormset(initial=[
-            {
-                'submitted_by': self.request.user
-            }
-        ])
+            context_data['ticketnotes'] = TicketTicketNoteFormset()
 
 
         return context_data
 
     def get_initial(self):
-        tech_emails = [tech.user.email for tech in Technician.objects.filter(is_current=True).filter(user__isnull=False)]
-        all_recipient_emails = ( tech_emails + [ self.request.user.email ] ) if self.request.user.email not in tech_emails else tech_emails
         return {
-            'recipient_emails': ",\n".join(all_recipient_emails)
+            'recipient_emails': get_default_recipient_emails(self.request.user)
         }
 
     def form_valid(self, form):
 
-        response = super().form_valid(form)
+        ticketnotes = TicketTicketNoteFormset(self.request.POST, instance=form.instance)
 
-        self.object = form.save(commit=False)
-        self.object.submitted_by = self.request.user
-        if not 'recipient_emails' in self.request.POST:
-            self.object.recipient_emails = self.get_initial()['recipient_emails']
+        if not ticketnotes.is_valid():
+            return self.form_invalid(form)
 
-        self.object.save()
+        with transaction.atomic():
+            self.object = form.save(commit=False)
+            self.object.submitted_by = self.request.user
+            if not 'recipient_emails' in self.request.POST:
+                self.object.recipient_emails = self.get_initial()['recipient_emails']
 
-        ticketnotes = TicketTicketNoteFormset(self.request.POST, instance=self.object)
+            self.object.save()
+            form.save_m2m()
 
-        if(ticketnotes).is_valid():
-            for form in ticketnotes.forms:
-                ticketnote = form.save(commit=False)
+            for ticketnoteform in ticketnotes.forms:
+                ticketnote = ticketnoteform.save(commit=False)
                 if ticketnote.submitted_by is None:
                     ticketnote.submitted_by = self.request.user
             ticketnotes.save()
-        else:
-            return self.form_invalid(form)
 
+            History.objects.bulk_create(
+                get_history(form, 'ticket', self.object, self.request.user)
+                + get_formset_history(ticketnotes, 'ticketnote', self.request.user)
+            )
 
-        if not 'donot_send' in self.request.POST:
-            send_ticket_mail(self.object, self.request, is_new=True)
+            if not 'donot_send' in self.request.POST:
+                send_ticket_mail(self.object, self.request, is_new=True)
 
-        return response
+        return HttpResponseRedirect(self.get_success_url())
 
     def get_success_url(self):
         return reverse_lazy('libtekticket:ticket-detail', kwargs={'pk': self.object.pk})
@@ -175,44 +388,67 @@ class TicketUpdate(PermissionRequiredMixin, UpdateView):
 
     model = Ticket
     form_class = TicketForm
+    paginate_ticketnotes_by = 20
+
+    def get_ticketnote_formset(self):
+        """The formset for the notes submitted with the ticket
+
+        Unless LIBTEKTICKET_EDIT_EXISTING_NOTES is set, the formset only holds the
+        notes being added, and existing notes are listed read-only, so they
+        are not rendered, posted and validated on every save
+
+        """
+
+        kwargs = {'instance': self.object}
+        if not getattr(settings, 'LIBTEKTICKET_EDIT_EXISTING_NOTES', False):
+            kwargs['queryset'] = TicketNote.objects.none()
+
+        if self.request.POST:
+            return TicketTicketNoteFormset(self.request.POST, **kwargs)
+        return TicketTicketNoteFormset(**kwargs)
 
     def get_context_data(self, **kwargs):
 
         context_data = super().get_context_data(**kwargs)
 
-        if self.request.POST:
-            context_data['ticketnotes'] = TicketTicketNoteFormset(self.request.POST, instance=self.object)
-        else:
-            context_data['ticketnotes'] = TicketTicketNoteFormset(instance=self.object, initial=[{'submitted_by':self.request.user}])
+        context_data['ticketnotes'] = self.get_ticketnote_formset()
+        context_data['ticketnote_page'] = Paginator(
+            self.object.ticketnote_set.order_by('-when', '-pk'),
+            self.paginate_ticketnotes_by
+        ).get_page(self.request.GET.get('notes_page'))
 
         return context_data
 
 
     def form_valid(self, form):
 
-        response = super().form_valid(form)
+        ticketnotes = self.get_ticketnote_formset()
 
-        self.object = form.save()
+        if not ticketnotes.is_valid():
+            return self.form_invalid(form)
 
-        ticketnotes = TicketTicketNoteFormset(self.request.POST, instance=self.object, initial=[
-            {
-                'submitted_by': self.request.user
-            }
-        ])
+        with transaction.atomic():
+            # only the form's fields, so notes added since the ticket was read keep their counts
+            self.object = form.save(commit=False)
+            self.object.save(update_fields=Ticket.get_form_update_fields(form))
+            form.save_m2m()
 
-        if(ticketnotes).is_valid():
-            for form in ticketnotes.forms:
-                ticketnote = form.save(commit=False)
+            for ticketnoteform in ticketnotes.forms:
+                ticketnote = ticketnoteform.save(commit=False)
                 if ticketnote.submitted_by is None:
                     ticketnote.submitted_by = self.request.user
             ticketnotes.save()
-        else:
-            return self.form_invalid(form)
 
-        if not 'donot_send' in self.request.POST:
-            send_ticket_mail(self.object, self.request, is_new=False)
+            History.objects.bulk_create(
+                get_history(form, 'ticket', self.object, self.request.user)
+                + get_formset_history(ticketnotes, 'ticketnote', self.request.user)
+            )
 
-        return response
+            if not 'donot_send' in self.request.POST:
+                changes = describe_changes(form) + describe_note_changes(ticketnotes)
+                send_ticket_mail(self.object, self.request, is_new=False, changes=changes)
+
+        return HttpResponseRedirect(self.get_success_url())
 
     def get_success_url(self):
 
@@ -222,13 +458,23 @@ class TicketDetail(PermissionRequiredMixin, DetailView):
     permission_required = 'libtekticket.view_ticket'
     model = Ticket
 
+    def get_queryset(self):
+        return super().get_queryset().select_related('item', 'location', 'submitted_by')
+
+    def get_object(self, queryset=None):
+        # the version is read before the ticket, so a change committed in between gets a new version
+        # instead of its old rows being cached under the new one.  The page shows the names of the
+        # item, location and users, so it also changes with them
+        self.ticket_version = max(Ticket(pk=self.kwargs['pk']).get_cache_version(), get_related_labels_version())
+        return super().get_object(queryset)
+
     def get_context_data(self, **kwargs):
 
         context_data = super().get_context_data(**kwargs)
-        context_data['ticket_labels'] = {field.name: field.verbose_name.title(
-        ) for field in Ticket._meta.get_fields() if type(field).__name__[-3:] != 'Rel'}
-        context_data['ticketnote_labels'] = {field.name: field.verbose_name.title(
-        ) for field in TicketNote._meta.get_fields() if type(field).__name__[-3:] != 'Rel'}
+        context_data['ticket_labels'] = TICKET_LABELS
+        context_data['ticketnote_labels'] = TICKETNOTE_LABELS
+        context_data['ticket_version'] = self.ticket_version
+        context_data['detail_cache_timeout'] = getattr(settings, 'LIBTEKTICKET_DETAIL_CACHE_TIMEOUT', 300)
         return context_data
 
 
@@ -250,17 +496,37 @@ class TicketSoftDelete(PermissionRequiredMixin, UpdateView):
         context_data = super().get_context_data(**kwargs)
         context_data['current_notes'] = self.object.ticketnote_set.all().filter(
             is_current_status=True)
-        context_data['ticket_labels'] = {field.name: field.verbose_name.title(
-        ) for field in Ticket._meta.get_fields() if type(field).__name__[-3:] != 'Rel'}
-        context_data['ticketnote_labels'] = {field.name: field.verbose_name.title(
-        ) for field in TicketNote._meta.get_fields() if type(field).__name__[-3:] != 'Rel'}
+        context_data['ticket_labels'] = TICKET_LABELS
+        context_data['ticketnote_labels'] = TICKETNOTE_LABELS
 
         return context_data
 
+# cells starting with these are read as formulas by spreadsheets
+CSV_FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def escape_csv_value(value):
+    """A CSV cell value which a spreadsheet shows as text, with a ' before text that would start a formula"""
+
+    if isinstance(value, str) and value.startswith(CSV_FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+class Echo:
+    """A file-like object that returns what is written to it, for streaming csv.writer rows"""
+
+    def write(self, value):
+        return value
+
+
 class TicketList(PermissionRequiredMixin, ListView):
     permission_required = 'libtekticket.view_ticket'
     model = Ticket
     paginate_by = 30
+    related_columns = ['item', 'location', 'submitted_by', 'technician']
+    keyset_ordering = ['is_resolved', '-when', 'urgency', 'pk']
+    csv_chunk_size = 2000
 
     def setup(self, request, *args, **kwargs):
         self.vista_settings={
@@ -268,7 +534,7 @@ class TicketList(PermissionRequiredMixin, ListView):
             'fields':[],
         }
 
-        self.vista_settings['fields'] = make_vista_fields(Ticket, rels=True)
+        self.vista_settings['fields'] = get_vista_fields()
 
         self.vista_defaults = QueryDict(urlencode([
             ('filter__fieldname', ['is_resolved']),
@@ -281,9 +547,60 @@ class TicketList(PermissionRequiredMixin, ListView):
         return super().setup(request, *args, **kwargs)
 
 
-    def post(self, request, *args, **kwargs):
+    def get(self, request, *args, **kwargs):
+
+        csv_option_form = CSVOptionForm(request.GET)
+        if csv_option_form.is_valid() and csv_option_form.cleaned_data['make_csv']:
+            return self.render_csv(self.get_queryset())
+
         return super().get(request, *args, **kwargs)
 
+    def post(self, request, *args, **kwargs):
+        return self.get(request, *args, **kwargs)
+
+    def get_csv_columns(self):
+        """The (values_list field, heading) of each CSV column, with related objects as their names"""
+
+        return [
+            ('pk', 'ID'),
+            ('item__common_name', TICKET_LABELS['item']),
+            ('location__full_name', TICKET_LABELS['location']),
+            ('short_description', TICKET_LABELS['short_description']),
+            ('long_description', TICKET_LABELS['long_description']),
+            ('urgency', TICKET_LABELS['urgency']),
+            (f'submitted_by__{get_user_model().USERNAME_FIELD}', TICKET_LABELS['submitted_by']),
+            ('when', TICKET_LABELS['when']),
+            ('technician__name', TICKET_LABELS['technician']),
+            ('is_resolved', TICKET_LABELS['is_resolved']),
+            ('resolution_notes', TICKET_LABELS['resolution_notes']),
+        ]
+
+    def render_csv(self, queryset):
+        """Stream the tickets as CSV, fetching them in chunks so memory use doesn't grow with the list"""
+
+        columns = self.get_csv_columns()
+        fieldnames = [fieldname for fieldname, heading in columns]
+        urgency_index = fieldnames.index('urgency')
+        is_resolved_index = fieldnames.index('is_resolved')
+        urgency_labels = dict(Ticket.URGENCY_CHOICES)
+
+        rows = queryset.values_list(*fieldnames).iterator(chunk_size=self.csv_chunk_size)
+        writer = csv.writer(Echo())
+
+        def lines():
+            yield writer.writerow([heading for fieldname, heading in columns])
+            for row in rows:
+                row = list(row)
+                row[urgency_index] = urgency_labels.get(row[urgency_index], row[urgency_index])
+                row[is_resolved_index] = 'yes' if row[is_resolved_index] else 'no'
+                yield writer.writerow([escape_csv_value(value) for value in row])
+
+        return StreamingHttpResponse(
+            lines(),
+            content_type='text/csv',
+            headers={'Content-Disposition': 'attachment; filename="tickets.csv"'},
+        )
+
     def get_queryset(self):
 
         queryset = super().get_queryset()
@@ -325,14 +642,56 @@ class TicketList(PermissionRequiredMixin, ListView):
 
             )
         else:
-            self.vistaobj = default_vista(
-                self.request.user,
-                queryset,
-                self.vista_defaults,
-                self.vista_settings
-            )
+            self.vistaobj = self.get_default_vista(queryset)
+
+        queryset = self.vistaobj['queryset'].select_related(*self.get_related_columns())
+
+        self.search_query = self.request.GET.get('q', '').strip()
+        if self.search_query:
+            queryset = search_tickets(self.search_query, queryset)
+
+        return queryset
+
+    def get_default_vista(self, queryset):
+        """The user's default vista, cached as its query and querydict until a vista changes"""
+
+        timeout = getattr(settings, 'LIBTEKTICKET_VISTA_CACHE_TIMEOUT', 300)
+        if not timeout:
+            return default_vista(self.request.user, queryset, self.vista_defaults, self.vista_settings)
+
+        key = get_vista_cache_key(self.request.user, 'default')
+        cached = cache.get(key)
+        if cached is not None:
+            queryset = queryset.all()
+            queryset.query = cached['query']
+            return {'queryset': queryset, 'querydict': QueryDict(cached['querydict'])}
 
-        return self.vistaobj['queryset']
+        vistaobj = default_vista(self.request.user, queryset, self.vista_defaults, self.vista_settings)
+        cache.set(key, {'query': vistaobj['queryset'].query, 'querydict': vistaobj['querydict'].urlencode()}, timeout)
+        return vistaobj
+
+    def get_vistas(self):
+        """The user's saved ticket vistas, for choosing one, cached until a vista changes"""
+
+        timeout = getattr(settings, 'LIBTEKTICKET_VISTA_CACHE_TIMEOUT', 300)
+        key = get_vista_cache_key(self.request.user, 'list')
+        vistas = cache.get(key) if timeout else None
+        if vistas is None:
+            vistas = list(Vista.objects.filter(user=self.request.user, model_name='libtekin.ticket'))
+            if timeout:
+                cache.set(key, vistas, timeout)
+        return vistas
+
+    def get_related_columns(self):
+        """The foreign keys shown in the list, which are fetched with the tickets instead of one query per row"""
+
+        show_columns = self.vistaobj['querydict'].getlist('show_columns')
+
+        # the template shows every column when none are chosen
+        if not show_columns:
+            return self.related_columns
+
+        return [column for column in self.related_columns if column in show_columns]
 
     def get_paginate_by(self, queryset):
 
@@ -341,6 +700,42 @@ class TicketList(PermissionRequiredMixin, ListView):
 
         return super().get_paginate_by(self)
 
+    def use_keyset_pagination(self, queryset):
+        # keyset pages follow the default ordering, so a vista with its own ordering uses page numbers
+        return getattr(settings, 'LIBTEKTICKET_KEYSET_PAGINATION', False) and not queryset.query.order_by
+
+    def get_paginator(self, queryset, per_page, orphans=0, allow_empty_first_page=True, **kwargs):
+        """A paginator which caches the ordered ticket ids of the list until any ticket changes"""
+
+        timeout = getattr(settings, 'LIBTEKTICKET_LIST_CACHE_TIMEOUT', 30)
+        signature = CachedPKPaginator.get_query_signature(queryset) if timeout else None
+        return CachedPKPaginator(
+            queryset,
+            per_page,
+            orphans=orphans,
+            allow_empty_first_page=allow_empty_first_page,
+            cache_key=signature and f'libtekticket_ticket_pks_{signature}_{Ticket.get_list_cache_version()}',
+            timeout=timeout,
+            max_ids=getattr(settings, 'LIBTEKTICKET_LIST_CACHE_MAX_IDS', 10000),
+        )
+
+    def paginate_queryset(self, queryset, page_size):
+
+        if not self.use_keyset_pagination(queryset):
+            return super().paginate_queryset(queryset, page_size)
+
+        paginator = KeysetPaginator(queryset, page_size, self.keyset_ordering)
+        try:
+            page = paginator.page(
+                after=self.request.GET.get('after'),
+                before=self.request.GET.get('before'),
+                last='last' in self.request.GET,
+            )
+        except InvalidPage as e:
+            raise Http404(str(e))
+
+        return (paginator, page, page.object_list, page.has_other_pages())
+
     def get_context_data(self, **kwargs):
 
         context_data = super().get_context_data(**kwargs)
@@ -348,13 +743,67 @@ class TicketList(PermissionRequiredMixin, ListView):
         vista_data = vista_context_data(self.vista_settings, self.vistaobj['querydict'])
         context_data = {**context_data, **vista_data}
 
-        context_data['vistas'] = Vista.objects.filter(user=self.request.user, model_name='libtekin.ticket').all() # for choosing saved vistas
+        context_data['vistas'] = self.get_vistas() # for choosing saved vistas
 
         if self.request.POST.get('vista_name'):
             context_data['vista_name'] = self.request.POST.get('vista_name')
 
+        context_data['search_query'] = self.search_query
+        context_data['event_stream'] = getattr(settings, 'LIBTEKTICKET_EVENT_STREAM', False)
+        context_data['event_poll_seconds'] = getattr(settings, 'LIBTEKTICKET_EVENT_POLL_SECONDS', 30)
+        context_data['csv_option_form'] = CSVOptionForm()
+        context_data['bulk_form'] = TicketBulkForm()
+
         return context_data
 
+class TicketBulkUpdate(PermissionRequiredMixin, View):
+    """Assign a technician, set the urgency or mark resolved the tickets chosen on the list"""
+
+    permission_required = 'libtekticket.change_ticket'
+
+    def post(self, request, *args, **kwargs):
+
+        form = TicketBulkForm(request.POST)
+        if not form.is_valid():
+            for error in form.errors.values():
+                messages.error(request, ' '.join(error))
+            return HttpResponseRedirect(reverse('libtekticket:ticket-list'))
+
+        changes = form.get_changes()
+        descriptions = []
+        for name, value in changes.items():
+            if name == 'urgency':
+                value = dict(Ticket.URGENCY_CHOICES)[value]
+            descriptions.append(f'{TICKET_LABELS[name]}: {value}')
+
+        with transaction.atomic():
+            ticket_ids = update_tickets([ticket.pk for ticket in form.cleaned_data['tickets']], changes, request.user)
+            if ticket_ids and not form.cleaned_data['donot_send']:
+                send_bulk_ticket_mail(ticket_ids, request, descriptions)
+
+        messages.success(request, f'{len(ticket_ids)} tickets changed')
+        return HttpResponseRedirect(reverse('libtekticket:ticket-list'))
+
+
+class TicketSubscribedList(PermissionRequiredMixin, ListView):
+    """The tickets the current user gets updates about, by their account or their email"""
+
+    permission_required = 'libtekticket.view_ticket'
+    model = Ticket
+    paginate_by = 30
+    template_name = 'libtekticket/ticket_subscribed_list.html'
+
+    def get_queryset(self):
+        subscriptions = TicketSubscriber.objects.for_user(self.request.user).values('ticket')
+        return super().get_queryset().filter(pk__in=subscriptions).select_related('location', 'technician')
+
+    def get_context_data(self, **kwargs):
+
+        context_data = super().get_context_data(**kwargs)
+        context_data['ticket_labels'] = TICKET_LABELS
+        return context_data
+
+
 class TicketTicketNoteCreate(PermissionRequiredMixin, CreateView):
     permission_required = 'libtekticket.add_ticketnote'
     model=TicketNote
@@ -363,14 +812,182 @@ class TicketTicketNoteCreate(PermissionRequiredMixin, CreateView):
 
     def form_valid(self, form):
 
-        self.object=form.save(commit=False)
-        self.object.ticket=Ticket.objects.get(pk=self.kwargs.get('ticketpk'))
-        self.object.submitted_by = self.request.user
-        self.object.save()
+        with transaction.atomic():
+            self.object=form.save(commit=False)
+            self.object.ticket=Ticket.objects.get(pk=self.kwargs.get('ticketpk'))
+            self.object.submitted_by = self.request.user
+            self.object.save()
 
-        send_ticket_mail(self.object.ticket, self.request, is_new=False)
+            update_history(form, 'ticketnote', self.object, self.request.user)
 
-        return super().form_valid(form)
+            send_ticket_mail(self.object.ticket, self.request, is_new=False, changes=[f'Note added: {self.object.maintext}'])
+
+        return HttpResponseRedirect(self.get_success_url())
 
     def get_success_url(self):
         return reverse_lazy('libtekticket:ticket-detail', kwargs={'pk': self.object.ticket.pk})
+
+
+class ItemSearch(PermissionRequiredMixin, View):
+    """Items matching the q parameter as JSON, for the ticket form's item search
+
+    Matches the start of the primary id or any part of the item's name, its
+    home's names or its assignee's names.  Returns at most the limit
+    parameter (default 20, at most 100) results.  Open to users who can add
+    or change tickets, since both forms use it
+
+    """
+
+    permission_required = ('libtekticket.add_ticket', 'libtekticket.change_ticket')
+    raise_exception = True
+    default_limit = 20
+    max_limit = 100
+
+    def has_permission(self):
+        return any(self.request.user.has_perm(perm) for perm in self.get_permission_required())
+
+    def get(self, request, *args, **kwargs):
+
+        search = request.GET.get('q', '').strip()
+
+        try:
+            limit = min(int(request.GET.get('limit', self.default_limit)), self.max_limit)
+        except ValueError:
+            limit = self.default_limit
+
+        items = Item.objects.select_related('home', 'assignee')
+        if search:
+            items = items.filter(
+                Q(primary_id__istartswith=search)
+                | Q(common_name__icontains=search)
+                | Q(home__short_name__icontains=search)
+                | Q(home__full_name__icontains=search)
+                | Q(assignee__friendly_name__icontains=search)
+                | Q(assignee__full_name__icontains=search)
+            )
+
+        results = []
+        for item in items[:max(limit, 0)]:
+            pk, label, home, textforfilter = get_item_choice(item)
+            results.append({'id': pk, 'text': label, 'home': home, 'textforfilter': textforfilter})
+
+        return JsonResponse({'results': results})
+
+
+class TicketMetrics(PermissionRequiredMixin, TemplateView):
+    """Ticket counts, average response times and the backlog, read from the metric rollups"""
+
+    permission_required = 'libtekticket.view_ticket'
+    template_name = 'libtekticket/metrics.html'
+
+    def get_context_data(self, **kwargs):
+
+        context_data = super().get_context_data(**kwargs)
+
+        form = MetricsForm(self.request.GET or None)
+        options = form.cleaned_data if form.is_valid() else {}
+        start, end = metrics.get_default_range()
+        start = options.get('start') or start
+        end = options.get('end') or end
+        group_by = options.get('group_by') or 'technician'
+
+        context_data['metrics_form'] = form
+        context_data['start'] = start
+        context_data['end'] = end
+        context_data['group_by'] = group_by
+        context_data['rows'] = metrics.get_summary(start, end, group_by)
+        return context_data
+
+
+class TicketMetricsJSON(TicketMetrics):
+    raise_exception = True
+
+    def render_to_response(self, context, **response_kwargs):
+        return JsonResponse({
+            'start': context['start'].isoformat(),
+            'end': context['end'].isoformat(),
+            'group_by': context['group_by'],
+            'results': context['rows'],
+        })
+
+
+class TicketEventStream(PermissionRequiredMixin, View):
+    """Ticket events as server-sent events, for the ticket list to update itself
+
+    Starts after the Last-Event-ID header or the after parameter, or with new
+    events if neither is given.  Each stream ends after stream_seconds and the
+    browser reconnects from the last event it got.  Requests served through
+    ASGI on Django 4.2 and later wait without holding a thread; under WSGI
+    the events are written from the worker thread as they happen
+
+    """
+
+    permission_required = 'libtekticket.view_ticket'
+    raise_exception = True
+    heartbeat_seconds = 15
+    stream_seconds = 300
+
+    def get(self, request, *args, **kwargs):
+
+        backend = events.get_backend()
+        try:
+            after = int(request.headers.get('Last-Event-ID') or request.GET.get('after') or backend.last_id())
+        except ValueError:
+            after = backend.last_id()
+
+        # WSGI reads an async iterator to the end before sending any of it
+        if isinstance(request, ASGIRequest) and django.VERSION >= (4, 2):
+            stream = self.stream_async(backend, after)
+        else:
+            stream = self.stream(backend, after)
+
+        response = StreamingHttpResponse(stream, content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    def stream(self, backend, after):
+        deadline = time.monotonic() + self.stream_seconds
+        yield 'retry: 3000\n\n'
+        while time.monotonic() < deadline:
+            new_events = backend.wait(after, self.heartbeat_seconds)
+            if not new_events:
+                yield ': keepalive\n\n'
+            for event in new_events:
+                after = event['id']
+                yield events.format_event(event)
+
+    async def stream_async(self, backend, after):
+        deadline = time.monotonic() + self.stream_seconds
+        yield 'retry: 3000\n\n'
+        while time.monotonic() < deadline:
+            new_events = await backend.wait_async(after, self.heartbeat_seconds)
+            if not new_events:
+                yield ': keepalive\n\n'
+            for event in new_events:
+                after = event['id']
+                yield events.format_event(event)
+
+
+class TicketEventPoll(PermissionRequiredMixin, View):
+    """Ticket events as JSON, waiting up to timeout seconds for one, for clients without server-sent events
+
+    Without the after parameter, returns no events and the id to pass as after next time
+
+    """
+
+    permission_required = 'libtekticket.view_ticket'
+    raise_exception = True
+    max_timeout = 25
+
+    def get(self, request, *args, **kwargs):
+
+        backend = events.get_backend()
+        try:
+            after = int(request.GET['after'])
+            timeout = min(float(request.GET.get('timeout', self.max_timeout)), self.max_timeout)
+        except (KeyError, ValueError):
+            return JsonResponse({'events': [], 'last_id': backend.last_id()})
+
+        new_events = backend.wait(after, max(timeout, 0))
+        return JsonResponse({'events': new_events, 'last_id': new_events[-1]['id'] if new_events else after})